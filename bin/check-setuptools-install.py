@@ -0,0 +1,147 @@
+"""
+Check that installing the bundled Setuptools egg without a subprocess
+(install_setuptools_egg()) gives the same environment as ez_setup.py.
+
+For each of a zipped and an unzipped egg, two environments are created
+with the virtualenv.py under test, one with each way of installing
+Setuptools, and compared: the files in site-packages, the .pth files,
+the easy_install scripts, and what the environment's interpreter then
+reports about Setuptools.  Paths into the environments are compared
+with the environment's own directory left out.  Only the bundled eggs
+are used, so no network is needed.  Exits with status 1 if anything
+differs.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a child process for each environment: argv is the
+# virtualenv.py to use, the environment directory, whether to unzip
+# the egg and whether to go through ez_setup.py
+CHILD = """
+import sys, os
+virtualenv_py, home_dir, unzip, use_ez_setup = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(virtualenv_py))
+import virtualenv
+virtualenv.logger = virtualenv.Logger([])
+if use_ez_setup == 'yes':
+    virtualenv.install_setuptools_egg = lambda *args, **kw: False
+virtualenv.create_environment(home_dir, unzip_setuptools=unzip == 'yes')
+"""
+
+# Run by each environment's interpreter
+REPORT = """
+import pkg_resources, setuptools
+dist = pkg_resources.get_distribution('setuptools')
+print dist, dist.location
+print pkg_resources.load_entry_point(
+    'setuptools', 'console_scripts', 'easy_install').__module__
+"""
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [OPTIONS]")
+    parser.add_option(
+        '--virtualenv',
+        dest='virtualenv',
+        metavar='VIRTUALENV_PY',
+        default=os.path.join(here, '..', 'virtualenv.py'),
+        help='The virtualenv.py to check (default: the one of this checkout)')
+    options, args = parser.parse_args()
+    virtualenv_py = os.path.abspath(options.virtualenv)
+
+    work_dir = tempfile.mkdtemp(prefix='check-setuptools-install-')
+    failed = False
+    try:
+        for unzip in 'no', 'yes':
+            states = []
+            for use_ez_setup in 'no', 'yes':
+                home_dir = os.path.join(
+                    work_dir, 'unzip-%s-ez-setup-%s' % (unzip, use_ez_setup))
+                env = os.environ.copy()
+                env.pop('PYTHONPATH', None)
+                # easy_install of Setuptools 0.6 refuses to unpack an
+                # egg when byte-compiling is disabled
+                env.pop('PYTHONDONTWRITEBYTECODE', None)
+                code = subprocess.call(
+                    [sys.executable, '-c', CHILD, virtualenv_py, home_dir,
+                     unzip, use_ez_setup], env=env)
+                if code:
+                    print 'Could not create %s (status %s)' % (home_dir, code)
+                    sys.exit(1)
+                states.append(environment_state(home_dir))
+            differences = compare(states[0], states[1])
+            if differences:
+                failed = True
+                print 'unzip=%s: the environments differ:' % unzip
+                for line in differences:
+                    print '  ' + line
+            else:
+                print 'unzip=%s: the environments match (%s items)' % (
+                    unzip, len(states[0]))
+    finally:
+        shutil.rmtree(work_dir)
+    if failed:
+        sys.exit(1)
+
+def environment_state(home_dir):
+    """
+    Returns a dictionary describing what installing Setuptools put into
+    ``home_dir``, with ``home_dir`` replaced by ``ENV``
+    """
+    state = {}
+    bin_dir = os.path.join(home_dir, 'bin')
+    site_packages = os.path.join(
+        home_dir, 'lib', 'python%s' % sys.version[:3], 'site-packages')
+    for dirpath, dirnames, filenames in os.walk(site_packages):
+        for name in filenames:
+            if os.path.splitext(name)[1] in ('.pyc', '.pyo'):
+                # Which ones get written differs by how the egg was
+                # unpacked, and is of no consequence
+                continue
+            filename = os.path.join(dirpath, name)
+            relpath = filename[len(home_dir):]
+            if name.endswith('.pth'):
+                state[relpath] = read(filename, home_dir)
+            else:
+                state[relpath] = None
+    for name in os.listdir(bin_dir):
+        if name.startswith('easy_install'):
+            filename = os.path.join(bin_dir, name)
+            state['/bin/' + name] = (read(filename, home_dir),
+                                     os.access(filename, os.X_OK))
+    proc = subprocess.Popen(
+        [os.path.join(bin_dir, 'python'), '-c', REPORT],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    state['report'] = proc.communicate()[0].replace(home_dir, 'ENV')
+    return state
+
+def read(filename, home_dir):
+    f = open(filename, 'rb')
+    content = f.read()
+    f.close()
+    return content.replace(home_dir, 'ENV')
+
+def compare(state, expected):
+    """Lists how ``state`` (the fast path) differs from ``expected``
+    (ez_setup.py)"""
+    lines = []
+    keys = dict.fromkeys(state.keys() + expected.keys()).keys()
+    keys.sort()
+    for key in keys:
+        if key not in state:
+            lines.append('missing: %s' % key)
+        elif key not in expected:
+            lines.append('extra: %s' % key)
+        elif state[key] != expected[key]:
+            lines.append('%s: %r instead of %r' % (key, state[key],
+                                                   expected[key]))
+    return lines
+
+if __name__ == '__main__':
+    main()
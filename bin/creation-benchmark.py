@@ -0,0 +1,246 @@
+"""
+Benchmark creating and relocating environments.
+
+Times create_environment() with symlinked and with copied bootstrap
+modules, re-running it on an existing environment, and
+make_environment_relocatable() on environments with thousands of
+scripts, .pth files and .egg-link files.  Every measurement runs in a
+process of its own, which reports its phases (where the virtualenv.py
+under test records them, see --timings) and its peak memory.
+
+Only the bundled Setuptools eggs are used, so no network is needed.
+To compare two revisions, run this against each one's virtualenv.py
+(--virtualenv) with -o, then --compare the two result files.
+"""
+
+import os
+import sys
+import time
+import marshal
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a child process for each measurement: argv is the
+# virtualenv.py to use, the scenario, the environment directory and
+# the file to write the results to
+CHILD = """
+import sys, os, time, marshal
+virtualenv_py, scenario, home_dir, result_filename = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(virtualenv_py))
+import virtualenv
+virtualenv.logger = virtualenv.Logger([])
+if hasattr(virtualenv, 'Timings'):
+    virtualenv.timings = virtualenv.Timings(enabled=True)
+start = time.time()
+if scenario == 'relocate':
+    virtualenv.make_environment_relocatable(home_dir)
+elif scenario == 'create-copy':
+    virtualenv.create_environment(home_dir, symlink=False)
+else:
+    virtualenv.create_environment(home_dir)
+seconds = time.time() - start
+try:
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+except ImportError:
+    max_rss = None
+phases = []
+if hasattr(virtualenv, 'Timings'):
+    phases = [ (p['name'], p['seconds']) for p in virtualenv.timings.phases ]
+f = open(result_filename, 'wb')
+marshal.dump((seconds, max_rss, phases), f)
+f.close()
+"""
+
+SCENARIOS = ['create-symlink', 'create-copy', 'rerun', 'relocate']
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [OPTIONS]")
+    parser.add_option(
+        '--virtualenv',
+        dest='virtualenv',
+        metavar='VIRTUALENV_PY',
+        default=os.path.join(here, '..', 'virtualenv.py'),
+        help='The virtualenv.py to measure (default: the one of this checkout)')
+    parser.add_option(
+        '-n', '--repeat',
+        dest='repeat',
+        type='int',
+        default=5,
+        help='How many times to measure each scenario (default 5)')
+    parser.add_option(
+        '--files',
+        dest='files',
+        type='int',
+        default=2000,
+        help='How many scripts, .pth files and .egg-link files (each) '
+        'to relocate (default 2000)')
+    parser.add_option(
+        '-o', '--output',
+        dest='output',
+        metavar='FILE',
+        help='Also write the results to FILE')
+    parser.add_option(
+        '--compare',
+        dest='compare',
+        metavar='FILE',
+        help='Compare the results with those of an earlier run, from FILE')
+    options, args = parser.parse_args()
+    virtualenv_py = os.path.abspath(options.virtualenv)
+
+    work_dir = tempfile.mkdtemp(prefix='creation-benchmark-')
+    results = []
+    try:
+        for scenario in SCENARIOS:
+            runs = []
+            for i in range(options.repeat):
+                home_dir = os.path.join(work_dir, '%s-%s' % (scenario, i))
+                runs.append(measure(virtualenv_py, scenario, home_dir,
+                                    options.files))
+                shutil.rmtree(home_dir)
+            for result in summarize(scenario, runs):
+                results.append(result)
+                print format_result(result)
+                sys.stdout.flush()
+    finally:
+        shutil.rmtree(work_dir)
+
+    if options.output:
+        f = open(options.output, 'w')
+        for result in results:
+            f.write(format_result(result) + '\n')
+        f.close()
+    if options.compare:
+        compare(read_results(options.compare), results)
+
+def measure(virtualenv_py, scenario, home_dir, files):
+    """
+    Prepares ``home_dir`` for ``scenario`` and measures it, returning
+    ``(seconds, max_rss, phases)``
+    """
+    python = sys.executable
+    if scenario in ('rerun', 'relocate'):
+        run_child(python, virtualenv_py, 'create-symlink', home_dir)
+    if scenario == 'relocate':
+        add_relocatable_files(home_dir, files)
+        # Older revisions find the .pth files to fix up on sys.path, so
+        # this has to run in the environment
+        python = os.path.join(home_dir, 'bin', 'python')
+    return run_child(python, virtualenv_py, scenario, home_dir)
+
+def run_child(python, virtualenv_py, scenario, home_dir):
+    fd, result_filename = tempfile.mkstemp('.dat')
+    os.close(fd)
+    try:
+        env = os.environ.copy()
+        env.pop('PYTHONPATH', None)
+        code = subprocess.call(
+            [python, '-c', CHILD, virtualenv_py, scenario, home_dir,
+             result_filename], env=env)
+        if code:
+            print 'Scenario %s failed (status %s)' % (scenario, code)
+            sys.exit(1)
+        f = open(result_filename, 'rb')
+        result = marshal.load(f)
+        f.close()
+    finally:
+        os.unlink(result_filename)
+    return result
+
+def add_relocatable_files(home_dir, files):
+    """
+    Adds ``files`` scripts, .pth files and .egg-link files, all with
+    absolute paths, to the environment ``home_dir``
+    """
+    home_dir = os.path.abspath(home_dir)
+    bin_dir = os.path.join(home_dir, 'bin')
+    site_packages = os.path.join(
+        home_dir, 'lib', 'python%s' % sys.version[:3], 'site-packages')
+    for i in range(files):
+        write(os.path.join(bin_dir, 'script%05d' % i),
+              '#!%s/bin/python\nimport sys\nprint sys.argv\n' % home_dir)
+        package_dir = os.path.join(home_dir, 'src', 'package%05d' % i)
+        os.makedirs(package_dir)
+        write(os.path.join(site_packages, 'package%05d.pth' % i),
+              package_dir + '\n')
+        write(os.path.join(site_packages, 'package%05d.egg-link' % i),
+              package_dir + '\n.')
+
+def write(filename, content):
+    f = open(filename, 'w')
+    f.write(content)
+    f.close()
+
+def summarize(scenario, runs):
+    """
+    Turns the runs of ``scenario`` into result rows: the total time and
+    peak memory, then the time of each phase, all as medians
+    """
+    totals = [ seconds for seconds, max_rss, phases in runs ]
+    max_rsses = [ max_rss for seconds, max_rss, phases in runs
+                  if max_rss is not None ]
+    yield (scenario, 'total', median(totals),
+           max_rsses and median(max_rsses) or None)
+    names = []
+    times = {}
+    for seconds, max_rss, phases in runs:
+        for name, phase_seconds in phases:
+            if name not in times:
+                names.append(name)
+                times[name] = []
+            times[name].append(phase_seconds)
+    for name in names:
+        yield (scenario, name, median(times[name]), None)
+
+def median(values):
+    values = list(values)
+    values.sort()
+    return values[len(values) // 2]
+
+def format_result(result):
+    scenario, phase, seconds, max_rss = result
+    if max_rss is None:
+        max_rss = '-'
+    return '%s\t%s\t%.4f\t%s' % (scenario, phase, seconds, max_rss)
+
+def read_results(filename):
+    results = {}
+    f = open(filename)
+    for line in f:
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) != 4:
+            continue
+        scenario, phase, seconds, max_rss = parts
+        if max_rss == '-':
+            max_rss = None
+        else:
+            max_rss = int(max_rss)
+        results[(scenario, phase)] = (float(seconds), max_rss)
+    f.close()
+    return results
+
+def compare(old_results, results):
+    print
+    print '%-16s %-32s %9s %9s %7s %10s' % (
+        'scenario', 'phase', 'old', 'new', 'change', 'max rss')
+    for scenario, phase, seconds, max_rss in results:
+        old = old_results.get((scenario, phase))
+        if old is None:
+            continue
+        if old[0]:
+            change = '%+6.1f%%' % ((seconds - old[0]) / old[0] * 100)
+        else:
+            change = '-'
+        if old[1] is not None and max_rss is not None:
+            rss_change = '%+d' % (max_rss - old[1])
+        else:
+            rss_change = '-'
+        print '%-16s %-32s %9.4f %9.4f %7s %10s' % (
+            scenario, phase, old[0], seconds, change, rss_change)
+
+if __name__ == '__main__':
+    main()
@@ -8,11 +8,13 @@ import os
 here = os.path.dirname(__file__)
 script = os.path.join(here, '..', 'virtualenv.py')
 
+# The files are kept compressed and base64-encoded; virtualenv.py
+# decodes each one when it is first needed (see support_file())
 file_regex = re.compile(
-    r'##file (.*?)\n([a-zA-Z][a-zA-Z0-9_]+)\s*=\s*"""\n(.*?)"""\.decode\("base64"\)\.decode\("zlib"\)\n',
+    r'##file ([^\n]*)\n(EMBEDDED_FILES\[[^\n]*\])\s*=\s*"""\n(.*?)"""\n',
     re.S)
 
-file_template = '##file %(filename)s\n%(varname)s = """\n%(data)s""".decode("base64").decode("zlib")\n'
+file_template = '##file %(filename)s\n%(varname)s = """\n%(data)s"""\n'
 
 def rebuild():
     f = open(script, 'rb')
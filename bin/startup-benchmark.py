@@ -0,0 +1,239 @@
+"""
+Benchmark the startup of virtualenv environments against the system
+interpreter, to catch regressions in virtualenv_support/site.py.
+
+Run this with the interpreter to measure; it builds its fixtures
+(environments with 0, 100 and 1000 .pth entries, with and without the
+global site-packages, and one environment stacked on another) with
+../virtualenv.py in a scratch directory, without network access.  Each
+scenario runs ``python -c pass`` and a typical import workload; the
+results are written as tab-separated lines (scenario, workload, best
+and median seconds, syscalls) that --compare can hold against the
+results of an earlier run.  Syscalls are counted with strace, where it
+is installed.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+virtualenv_py = os.path.join(here, '..', 'virtualenv.py')
+
+WORKLOADS = [
+    ('pass', 'pass'),
+    ('imports', 'import os, re, optparse, logging, subprocess, tempfile, shutil, urllib'),
+    ]
+
+PTH_COUNTS = [0, 100, 1000]
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [OPTIONS]")
+    parser.add_option(
+        '-n', '--repeat',
+        dest='repeat',
+        type='int',
+        default=20,
+        help='How many times to run each workload (default 20)')
+    parser.add_option(
+        '--work-dir',
+        dest='work_dir',
+        metavar='DIR',
+        help='Build the fixtures in DIR, and keep them (default: a '
+        'temporary directory, deleted afterwards)')
+    parser.add_option(
+        '-o', '--output',
+        dest='output',
+        metavar='FILE',
+        help='Also write the results to FILE')
+    parser.add_option(
+        '--compare',
+        dest='compare',
+        metavar='FILE',
+        help='Compare the results with those of an earlier run, from FILE')
+    options, args = parser.parse_args()
+
+    if options.work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='startup-benchmark-')
+    else:
+        work_dir = os.path.abspath(options.work_dir)
+    try:
+        scenarios = build_fixtures(work_dir)
+        results = []
+        for name, executable in scenarios:
+            for workload, code in WORKLOADS:
+                best, median = time_command(
+                    [executable, '-c', code], options.repeat)
+                syscalls = count_syscalls([executable, '-c', code])
+                results.append((name, workload, best, median, syscalls))
+                print format_result(results[-1])
+                sys.stdout.flush()
+    finally:
+        if options.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    if options.output:
+        f = open(options.output, 'w')
+        for result in results:
+            f.write(format_result(result) + '\n')
+        f.close()
+    if options.compare:
+        compare(read_results(options.compare), results)
+
+def build_fixtures(work_dir):
+    """
+    Creates the environments to measure in ``work_dir`` (unless they
+    are there already), returning ``(scenario, executable)`` pairs
+    """
+    scenarios = [('system', sys.executable)]
+    for site_packages in True, False:
+        for count in PTH_COUNTS:
+            name = 'env-%spth' % count
+            if not site_packages:
+                name += '-no-site-packages'
+            home_dir = os.path.join(work_dir, name)
+            executable = make_environment(sys.executable, home_dir,
+                                          site_packages)
+            add_pth_entries(home_dir, executable, count)
+            scenarios.append((name, executable))
+    # An environment stacked on env-100pth, i.e. whose orig-prefix.txt
+    # names that environment rather than the system Python:
+    home_dir = os.path.join(work_dir, 'env-stacked')
+    if not os.path.exists(home_dir):
+        executable = make_environment(sys.executable, home_dir, True)
+        orig_prefix = os.path.join(site_packages_dir(executable), '..',
+                                   'orig-prefix.txt')
+        f = open(orig_prefix, 'w')
+        f.write(os.path.join(work_dir, 'env-100pth'))
+        f.close()
+    scenarios.append(('env-stacked',
+                      make_environment(sys.executable, home_dir, True)))
+    return scenarios
+
+def make_environment(python, home_dir, site_packages):
+    if not os.path.exists(home_dir):
+        cmd = [python, virtualenv_py, '-q', home_dir]
+        if not site_packages:
+            cmd.insert(2, '--no-site-packages')
+        subprocess.call(cmd)
+    executable = os.path.join(home_dir, 'bin', 'python')
+    if sys.platform == 'win32':
+        executable = os.path.join(home_dir, 'Scripts', 'python.exe')
+    if not os.path.exists(executable):
+        print 'Could not create %s' % home_dir
+        sys.exit(1)
+    return executable
+
+def add_pth_entries(home_dir, executable, count):
+    """
+    Adds ``count`` directories to the site-packages of the environment,
+    through .pth files of ten lines each
+    """
+    site_packages = site_packages_dir(executable)
+    entries_dir = os.path.join(home_dir, 'pth-entries')
+    for start in range(0, count, 10):
+        lines = []
+        for i in range(start, min(start + 10, count)):
+            path = os.path.join(entries_dir, 'entry%04d' % i)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            lines.append(path + '\n')
+        f = open(os.path.join(site_packages, 'bench%04d.pth' % start), 'w')
+        f.writelines(lines)
+        f.close()
+
+def site_packages_dir(executable):
+    return subprocess.Popen(
+        [executable, '-c',
+         'from distutils.sysconfig import get_python_lib; print get_python_lib()'],
+        stdout=subprocess.PIPE).communicate()[0].strip()
+
+def clean_environ():
+    env = os.environ.copy()
+    for name in 'PYTHONPATH', 'PYTHONHOME', 'PYTHONVERBOSE', 'VIRTUALENV_SITE_TRACE':
+        env.pop(name, None)
+    return env
+
+def time_command(cmd, repeat):
+    """Returns the best and the median wall time of ``cmd``, after one
+    run to warm the caches"""
+    env = clean_environ()
+    subprocess.call(cmd, env=env)
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        subprocess.call(cmd, env=env)
+        times.append(time.time() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+def count_syscalls(cmd):
+    """Returns how many system calls ``cmd`` makes, or None without
+    strace"""
+    fd, filename = tempfile.mkstemp('.strace')
+    os.close(fd)
+    try:
+        try:
+            proc = subprocess.Popen(
+                ['strace', '-f', '-c', '-o', filename] + cmd,
+                env=clean_environ(), stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        except OSError:
+            return None
+        proc.communicate()
+        f = open(filename)
+        lines = f.read().splitlines()
+        f.close()
+    finally:
+        os.unlink(filename)
+    for line in lines:
+        parts = line.split()
+        # The summary line: % time, seconds, usecs/call, calls, [errors,] "total"
+        if parts and parts[-1] == 'total':
+            return int(parts[3])
+    return None
+
+def format_result(result):
+    name, workload, best, median, syscalls = result
+    if syscalls is None:
+        syscalls = '-'
+    return '%s\t%s\t%.4f\t%.4f\t%s' % (name, workload, best, median, syscalls)
+
+def read_results(filename):
+    results = {}
+    f = open(filename)
+    for line in f:
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) != 5:
+            continue
+        name, workload, best, median, syscalls = parts
+        if syscalls == '-':
+            syscalls = None
+        else:
+            syscalls = int(syscalls)
+        results[(name, workload)] = (float(best), float(median), syscalls)
+    f.close()
+    return results
+
+def compare(old_results, results):
+    print
+    print '%-32s %-8s %9s %9s %7s %9s' % (
+        'scenario', 'workload', 'old', 'new', 'change', 'syscalls')
+    for name, workload, best, median, syscalls in results:
+        old = old_results.get((name, workload))
+        if old is None:
+            continue
+        if old[2] is not None and syscalls is not None:
+            syscall_change = '%+d' % (syscalls - old[2])
+        else:
+            syscall_change = '-'
+        print '%-32s %-8s %9.4f %9.4f %+6.1f%% %9s' % (
+            name, workload, old[1], median,
+            (median - old[1]) / old[1] * 100, syscall_change)
+
+if __name__ == '__main__':
+    main()
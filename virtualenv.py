@@ -39,6 +39,24 @@ if sys.version_info[:2] == (2, 6):
 if sys.version_info[:2] <= (2, 3):
     REQUIRED_MODULES.extend(['sets', '__future__'])
 
+# What --trace-modules links besides the modules it sees imported:
+# distutils reads config/ through the environment's prefix, and the
+# environment's site.py can import extension modules (like time, for
+# VIRTUALENV_SITE_TRACE) before the real standard library is on sys.path
+UNTRACED_MODULES = ['config', 'lib-dynload']
+
+# How many files copyfiles() works on at once by default
+FILE_JOBS = 8
+
+# How many environments create_environments() creates at once by default
+BATCH_JOBS = 4
+
+# The files of virtualenv_support/ embedded at the end of this script
+# (see bin/rebuild-script.py), compressed and base64-encoded, by name;
+# support_file() decodes them as they are needed
+EMBEDDED_FILES = {}
+_decoded_files = {}
+
 class Logger(object):
 
     """
@@ -179,37 +197,267 @@ class Logger(object):
 
     level_for_integer = classmethod(level_for_integer)
 
+class Timings(object):
+
+    """
+    Times the phases of creating an environment, and counts the file
+    operations done in each, to be written out as JSON.  Does nothing
+    unless ``enabled``.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self.reset()
+        try:
+            import threading
+        except ImportError:
+            self.lock = None
+        else:
+            # copyfiles() counts from several threads
+            self.lock = threading.Lock()
+
+    def reset(self):
+        import time
+        self.start = self.last = time.time()
+        self.file_ops = {}
+
+    def count(self, operation):
+        """Counts one file operation (e.g. 'copy') of the current phase"""
+        if not self.enabled:
+            return
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            self.file_ops[operation] = self.file_ops.get(operation, 0) + 1
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def phase(self, name):
+        """Ends the phase ``name``, which started when the last one ended"""
+        import time
+        if not self.enabled:
+            return
+        now = time.time()
+        self.phases.append({'name': name, 'seconds': now - self.last,
+                            'file_ops': self.file_ops})
+        self.last = now
+        self.file_ops = {}
+
+    def write(self, filename, **extra):
+        """Writes the phases, and ``extra``, as a JSON object to
+        ``filename`` ('-' for stdout)"""
+        write_timings(filename, self.last - self.start, self.phases,
+                      **extra)
+
+def write_timings(filename, total_seconds, phases, append=False, **extra):
+    """
+    Writes ``phases`` (see ``Timings``), their ``total_seconds`` and
+    ``extra`` as a JSON object on a line of its own to ``filename``
+    ('-' for stdout), after what it holds already if ``append``.
+    """
+    data = {'total_seconds': total_seconds, 'phases': phases}
+    data.update(extra)
+    content = json_dumps(data) + '\n'
+    if filename == '-':
+        sys.stdout.write(content)
+    else:
+        f = open(filename, append and 'a' or 'w')
+        f.write(content)
+        f.close()
+
+def json_dumps(value):
+    """Encodes ``value`` (made of dicts, lists, strings, numbers, bools
+    and None) as JSON, with the json module where there is one (Python
+    2.6 and later)"""
+    try:
+        import json
+    except ImportError:
+        pass
+    else:
+        try:
+            return json.dumps(value, sort_keys=True)
+        except UnicodeDecodeError:
+            # A str that is not UTF-8, which json_text() handles
+            pass
+    if value is None:
+        return 'null'
+    elif value is True:
+        return 'true'
+    elif value is False:
+        return 'false'
+    elif isinstance(value, (int, long)):
+        return str(value)
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, basestring):
+        chars = []
+        for char in json_text(value):
+            if char in u'"\\':
+                chars.append('\\' + str(char))
+            elif ord(char) < 32 or ord(char) > 126:
+                code = ord(char)
+                if code > 0xFFFF:
+                    # Outside the BMP (on a wide build): a surrogate pair
+                    code -= 0x10000
+                    chars.append('\\u%04x\\u%04x' % (0xD800 | (code >> 10),
+                                                     0xDC00 | (code & 0x3FF)))
+                else:
+                    chars.append('\\u%04x' % code)
+            else:
+                chars.append(str(char))
+        return '"%s"' % ''.join(chars)
+    elif isinstance(value, dict):
+        items = value.items()
+        items.sort()
+        return '{%s}' % ', '.join([ '%s: %s' % (json_dumps(str(k)), json_dumps(v))
+                                    for k, v in items ])
+    else:
+        return '[%s]' % ', '.join([ json_dumps(v) for v in value ])
+
+def json_text(value):
+    """Returns the str ``value`` as unicode, decoded as UTF-8 or else
+    in the filesystem encoding (it is mostly paths)"""
+    if isinstance(value, unicode):
+        return value
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode(sys.getfilesystemencoding() or 'latin-1',
+                            'replace')
+
+# Replaced by main() when --timings is given
+timings = Timings()
+
 def mkdir(path):
     if not os.path.exists(path):
         logger.info('Creating %s', path)
+        timings.count('mkdir')
         os.makedirs(path)
     else:
         logger.info('Directory %s already exists', path)
+    record_written(path)
 
-def copyfile(src, dest, symlink=True):
+def copyfile(src, dest, symlink=True, log=None):
+    if log is None:
+        log = logger.log
     if not os.path.exists(src):
         # Some bad symlink in the src
-        logger.warn('Cannot find file %s (bad symlink)', src)
+        log(Logger.WARN, 'Cannot find file %s (bad symlink)' % src)
         return
+    record_written(dest)
     if os.path.exists(dest):
-        logger.debug('File %s already exists', dest)
+        log(Logger.DEBUG, 'File %s already exists' % dest)
         return
     if not os.path.exists(os.path.dirname(dest)):
-        logger.info('Creating parent directories for %s' % os.path.dirname(dest))
-        os.makedirs(os.path.dirname(dest))
+        log(Logger.INFO, 'Creating parent directories for %s' % os.path.dirname(dest))
+        try:
+            os.makedirs(os.path.dirname(dest))
+        except OSError:
+            # Another copy running at the same time may have won the race
+            if not os.path.isdir(os.path.dirname(dest)):
+                raise
     if symlink and hasattr(os, 'symlink'):
-        logger.info('Symlinking %s', dest)
+        log(Logger.INFO, 'Symlinking %s' % dest)
+        timings.count('symlink')
         os.symlink(os.path.abspath(src), dest)
     else:
-        logger.info('Copying to %s', dest)
+        log(Logger.INFO, 'Copying to %s' % dest)
+        timings.count('copy')
         if os.path.isdir(src):
             shutil.copytree(src, dest, True)
         else:
             shutil.copy2(src, dest)
 
+def copyfiles(pairs, symlink=True, jobs=None):
+    """
+    Like ``copyfile()`` for every ``(src, dest)`` in ``pairs``, but up
+    to ``jobs`` (default ``FILE_JOBS``) files are handled at once,
+    which pays off on filesystems where every stat and copy is a round
+    trip to a server.  Messages are logged in the order of ``pairs``,
+    and the first error, in that order, is raised once every file has
+    been handled.
+    """
+    def copy(src, dest):
+        messages = []
+        def log(level, msg):
+            messages.append((level, msg))
+        try:
+            copyfile(src, dest, symlink, log)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            return messages, sys.exc_info()
+        return messages, None
+    outcomes = run_parallel(copy, pairs, jobs or FILE_JOBS)
+    for result, exc_info in outcomes:
+        if exc_info is None:
+            messages, exc_info = result
+            for level, msg in messages:
+                logger.log(level, msg)
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+def run_parallel(func, args_list, jobs):
+    """
+    Calls ``func(*args)`` for every ``args`` in ``args_list``, from up
+    to ``jobs`` threads.  Returns a list of ``(result, exc_info)`` in
+    the order of ``args_list``, where ``exc_info`` is None unless the
+    call raised an exception.
+    """
+    outcomes = [None] * len(args_list)
+    def call(index):
+        try:
+            outcomes[index] = (func(*args_list[index]), None)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            outcomes[index] = (None, sys.exc_info())
+    try:
+        import threading
+    except ImportError:
+        threading = None
+    if threading is None or jobs <= 1 or len(args_list) <= 1:
+        for index in range(len(args_list)):
+            call(index)
+        return outcomes
+    indexes = range(len(args_list))
+    indexes.reverse()
+    def work():
+        while True:
+            try:
+                # list.pop() is atomic, so the threads need no lock
+                index = indexes.pop()
+            except IndexError:
+                return
+            call(index)
+    threads = [ threading.Thread(target=work)
+                for i in range(min(jobs, len(args_list))) ]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def support_file(filename):
+    """
+    Returns the content of the embedded support file ``filename``
+    (e.g. ``'site.py'``), decoding it on first use
+    """
+    try:
+        return _decoded_files[filename]
+    except KeyError:
+        content = EMBEDDED_FILES[filename].decode('base64').decode('zlib')
+        _decoded_files[filename] = content
+        return content
+
 def writefile(dest, content, overwrite=True):
+    record_written(dest, digest=True)
     if not os.path.exists(dest):
         logger.info('Writing %s', dest)
+        timings.count('write')
         f = open(dest, 'wb')
         f.write(content)
         f.close()
@@ -218,14 +466,15 @@ def writefile(dest, content, overwrite=True):
         f = open(dest, 'rb')
         c = f.read()
         f.close()
+        timings.count('compare')
         if c != content:
             if not overwrite:
                 logger.notify('File %s exists with different content; not overwriting', dest)
                 return
             logger.notify('Overwriting %s with new content', dest)
-            f = open(dest, 'wb')
-            f.write(content)
-            f.close()
+            # Replaced rather than written into, as it may be hard
+            # linked to a template environment (see clone_environment())
+            rewrite_file(dest, content)
         else:
             logger.info('Content %s already in place', dest)
 
@@ -240,10 +489,13 @@ def make_exe(fn):
     if hasattr(os, 'chmod'):
         oldmode = os.stat(fn).st_mode & 07777
         newmode = (oldmode | 0555) & 07777
+        if newmode == oldmode:
+            # Leaves alone files shared with a template environment
+            return
         os.chmod(fn, newmode)
         logger.info('Changed mode of %s to %s', fn, oct(newmode))
 
-def install_setuptools(py_executable, unzip=False):
+def install_setuptools(py_executable, unzip=False, lib_dir=None):
     setup_fn = 'setuptools-0.6c11-py%s.egg' % sys.version[:3]
     search_dirs = ['.', os.path.dirname(__file__), join(os.path.dirname(__file__), 'virtualenv_support')]
     if os.path.splitext(os.path.dirname(__file__))[0] != 'virtualenv':
@@ -258,16 +510,19 @@ def install_setuptools(py_executable, unzip=False):
         if os.path.exists(join(dir, setup_fn)):
             setup_fn = join(dir, setup_fn)
             break
+    if (lib_dir and os.path.exists(setup_fn)
+        and install_setuptools_egg(py_executable, setup_fn, lib_dir, unzip)):
+        return
     if is_jython and os._name == 'nt':
         # Jython's .bat sys.executable can't handle a command line
         # argument with newlines
         import tempfile
         fd, ez_setup = tempfile.mkstemp('.py')
-        os.write(fd, EZ_SETUP_PY)
+        os.write(fd, support_file('ez_setup.py'))
         os.close(fd)
         cmd = [py_executable, ez_setup]
     else:
-        cmd = [py_executable, '-c', EZ_SETUP_PY]
+        cmd = [py_executable, '-c', support_file('ez_setup.py')]
     if unzip:
         cmd.append('--always-unzip')
     env = {}
@@ -298,6 +553,198 @@ def install_setuptools(py_executable, unzip=False):
         logger.end_progress()
         if is_jython and os._name == 'nt':
             os.remove(ez_setup)
+    if written_paths is not None and lib_dir:
+        # What easy_install wrote: the egg, its .pth files and scripts
+        site_packages = join(lib_dir, 'site-packages')
+        bin_dir = os.path.dirname(py_executable.strip('"'))
+        for dir, names in ((site_packages, os.listdir(site_packages)),
+                           (bin_dir, os.listdir(bin_dir))):
+            for name in names:
+                if (name.startswith('setuptools')
+                    or name.startswith('easy_install')
+                    or name == 'easy-install.pth'):
+                    record_written(join(dir, name))
+
+# What easy_install writes for a single installed egg
+EASY_INSTALL_PTH = """\
+import sys; sys.__plen = len(sys.path)
+./%s
+import sys; new=sys.path[sys.__plen:]; del sys.path[sys.__plen:]; p=getattr(sys,'__egginsert',0); sys.path[p:p]=new; sys.__egginsert = p+len(new)
+"""
+
+# What easy_install writes for a console script entry point
+EASY_INSTALL_SCRIPT = """\
+#!%(executable)s
+# EASY-INSTALL-ENTRY-SCRIPT: %(spec)r,%(group)r,%(name)r
+__requires__ = %(spec)r
+import sys
+from pkg_resources import load_entry_point
+
+sys.exit(
+   load_entry_point(%(spec)r, %(group)r, %(name)r)()
+)
+"""
+
+def install_setuptools_egg(py_executable, setup_fn, lib_dir, unzip=False):
+    """
+    Installs the Setuptools egg ``setup_fn`` into ``lib_dir`` the way
+    ``ez_setup.py`` would, but without starting an interpreter: the
+    egg is copied (or unpacked, if ``unzip``) into site-packages, next
+    to ``easy-install.pth`` and ``setuptools.pth``, and the
+    ``easy_install`` scripts are written.
+
+    Returns False, having done nothing, where easy_install does more
+    than that: on Windows and Jython (which get .exe launchers and
+    .bat files), or when site-packages already has other eggs.
+    """
+    import zipfile
+    if sys.platform == 'win32' or is_jython:
+        return False
+    site_packages = join(lib_dir, 'site-packages')
+    egg_name = os.path.basename(setup_fn)
+    pth_content = EASY_INSTALL_PTH % egg_name
+    pth_filename = join(site_packages, 'easy-install.pth')
+    if os.path.exists(pth_filename):
+        f = open(pth_filename, 'rb')
+        content = f.read()
+        f.close()
+        if content != pth_content:
+            logger.info('%s lists other eggs; using ez_setup' % pth_filename)
+            return False
+    egg = zipfile.ZipFile(setup_fn)
+    try:
+        pkg_info = egg.read('EGG-INFO/PKG-INFO')
+        entry_points = egg.read('EGG-INFO/entry_points.txt')
+        dest = join(site_packages, egg_name)
+        record_written(dest)
+        if os.path.exists(dest):
+            logger.info('Setuptools egg %s already installed' % dest)
+        elif unzip:
+            cached = None
+            if CACHE_DIR:
+                try:
+                    cached = cached_egg_dir(setup_fn)
+                except (IOError, OSError), e:
+                    logger.info('Cannot unpack %s into the cache (%s)'
+                                % (setup_fn, e))
+            if cached:
+                logger.info('Linking %s into %s' % (cached, dest))
+                # Hard links first, as they share the page cache between
+                # environments (reflinks do not); shrinks as cloning
+                # methods turn out not to work here:
+                methods = ['hardlink', 'reflink', 'copy']
+                for dirpath, dirnames, filenames in os.walk(cached):
+                    dest_dirpath = dest + dirpath[len(cached):]
+                    os.mkdir(dest_dirpath)
+                    for name in filenames:
+                        clone_file(join(dirpath, name),
+                                   join(dest_dirpath, name), methods)
+            else:
+                logger.info('Unpacking %s into %s' % (setup_fn, dest))
+                unpack_egg(egg, dest)
+        else:
+            logger.info('Copying %s to %s' % (setup_fn, dest))
+            timings.count('copy')
+            shutil.copy2(setup_fn, dest)
+    finally:
+        egg.close()
+    version = [ line.split(':', 1)[1].strip()
+                for line in pkg_info.splitlines()
+                if line.startswith('Version:') ][0]
+    spec = 'setuptools==%s' % version
+    logger.notify('Installing %s (from %s)' % (spec, egg_name))
+    writefile(pth_filename, pth_content)
+    writefile(join(site_packages, 'setuptools.pth'), './%s\n' % egg_name)
+    in_console_scripts = False
+    for line in entry_points.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            in_console_scripts = line == '[console_scripts]'
+        elif in_console_scripts and '=' in line:
+            name = line.split('=', 1)[0].strip()
+            script = join(os.path.dirname(py_executable), name)
+            writefile(script, EASY_INSTALL_SCRIPT % dict(
+                executable=os.path.abspath(py_executable), spec=spec,
+                group='console_scripts', name=name))
+            make_exe(script)
+    return True
+
+def unpack_egg(egg, dest):
+    """Unpacks the ``zipfile.ZipFile`` ``egg`` into ``dest``, and
+    compiles its modules"""
+    for name in egg.namelist():
+        filename = join(dest, *name.split('/'))
+        if name.endswith('/'):
+            mkdir(filename)
+            continue
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        timings.count('write')
+        f = open(filename, 'wb')
+        try:
+            f.write(egg.read(name))
+        finally:
+            f.close()
+        if filename.endswith('.py'):
+            filename, error = compile_file(filename)
+            if error:
+                logger.info('Could not compile %s: %s' % (filename, error))
+
+def cached_egg_dir(egg_filename):
+    """
+    Returns the directory in ``CACHE_DIR`` that holds the egg
+    ``egg_filename`` unpacked (and compiled by this version of
+    Python), unpacking it there first if needed.  The entry is named
+    after the MD5 digest of the egg, and its files are read-only, as
+    environments hard link them.
+
+    Any number of processes may fill the cache at once: each unpacks
+    into a directory of its own and renames it into place, and the
+    first to finish wins.
+    """
+    import zipfile
+    try:
+        from hashlib import md5
+    except ImportError:
+        from md5 import md5
+    f = open(egg_filename, 'rb')
+    try:
+        digest = md5(f.read()).hexdigest()
+    finally:
+        f.close()
+    eggs_dir = join(CACHE_DIR, 'eggs', '%s-py%s' % (digest, sys.version[:3]))
+    cached = join(eggs_dir, os.path.basename(egg_filename))
+    if os.path.isdir(cached):
+        return cached
+    if not os.path.isdir(eggs_dir):
+        try:
+            os.makedirs(eggs_dir)
+        except OSError:
+            # Another process may have made it meanwhile
+            if not os.path.isdir(eggs_dir):
+                raise
+    tmp_dir = '%s.tmp-%s' % (cached, os.getpid())
+    logger.info('Unpacking %s into %s' % (egg_filename, cached))
+    egg = zipfile.ZipFile(egg_filename)
+    try:
+        try:
+            unpack_egg(egg, tmp_dir)
+            for dirpath, dirnames, filenames in os.walk(tmp_dir):
+                for name in filenames:
+                    os.chmod(join(dirpath, name), 0444)
+        except:
+            shutil.rmtree(tmp_dir, True)
+            raise
+    finally:
+        egg.close()
+    try:
+        os.rename(tmp_dir, cached)
+    except OSError:
+        if not os.path.isdir(cached):
+            raise
+        logger.info('Another process filled %s first' % cached)
+        shutil.rmtree(tmp_dir)
+    return cached
 
 def filter_ez_setup(line):
     if not line.strip():
@@ -310,6 +757,7 @@ def filter_ez_setup(line):
     return Logger.INFO
 
 def main():
+    global CACHE_DIR, LOG_FILE
     parser = optparse.OptionParser(
         version="1.3.4dev",
         usage="%prog [OPTIONS] DEST_DIR")
@@ -355,6 +803,128 @@ def main():
         action='store_true',
         help="Unzip Setuptools when installing it")
 
+    parser.add_option(
+        '--lazy-pth-imports',
+        dest='lazy_pth_imports',
+        action='store_true',
+        help="Put off running the import lines of .pth files until a "
+        "module that they name is imported")
+
+    parser.add_option(
+        '--eager-pth',
+        dest='eager_pth',
+        metavar='NAME',
+        action='append',
+        default=[],
+        help="With --lazy-pth-imports, still run the import lines of the "
+        ".pth file NAME (or the import lines starting with NAME) at "
+        "startup.  Can be given several times")
+
+    parser.add_option(
+        '--precompile',
+        dest='precompile',
+        action='store_true',
+        help="Compile all Python sources of the new environment, "
+        "including site-packages, to bytecode")
+
+    parser.add_option(
+        '--refresh-bytecode',
+        dest='refresh_bytecode',
+        action='store_true',
+        help="Compile all Python sources of an EXISTING virtualenv "
+        "environment that have no up-to-date bytecode yet")
+
+    parser.add_option(
+        '-j', '--jobs',
+        dest='jobs',
+        metavar='N',
+        type='int',
+        help="Number of files to work on at once (default: the number of "
+        "CPUs when compiling, %s when copying)" % FILE_JOBS)
+
+    parser.add_option(
+        '--trace-modules',
+        dest='trace_modules',
+        action='store_true',
+        help="Put only the standard library modules into the environment "
+        "that this Python is seen to import before the environment's "
+        "site.py takes over (traced once per interpreter), rather than "
+        "those of a fixed list")
+
+    parser.add_option(
+        '--always-copy',
+        dest='symlink',
+        action='store_false',
+        default=True,
+        help="Copy the standard library modules the environment needs "
+        "instead of symlinking them")
+
+    parser.add_option(
+        '--python-link',
+        dest='python_link',
+        metavar='MODE',
+        type='choice',
+        choices=['copy', 'hardlink'],
+        default='copy',
+        help="How to put the interpreter into the environment: 'copy' "
+        "(the default) or 'hardlink', which lets all environments share "
+        "one executable (falling back to a copy where it cannot be "
+        "linked).  Symlinks cannot be used, as Python finds its prefix "
+        "from the real location of its executable")
+
+    parser.add_option(
+        '--no-cache',
+        dest='no_cache',
+        action='store_true',
+        help="Do not use or update what earlier runs learnt about the "
+        "interpreter (kept in %s, or $VIRTUALENV_CACHE_DIR)" % CACHE_DIR)
+
+    parser.add_option(
+        '--template',
+        dest='template',
+        metavar='TEMPLATE_DIR',
+        help="Create the environment by cloning the existing environment "
+        "TEMPLATE_DIR (with reflinks or hard links where possible) instead "
+        "of building it")
+
+    parser.add_option(
+        '--batch',
+        dest='batch',
+        action='store_true',
+        help="Create an environment in each of several DEST_DIRs, "
+        "several at a time (see --jobs, default %s)" % BATCH_JOBS)
+
+    parser.add_option(
+        '--serve',
+        dest='serve',
+        metavar='SOCKET',
+        help="Keep running, creating environments (with this Python) for "
+        "clients that connect to the Unix socket SOCKET with --connect, "
+        "several at a time (see --jobs, default %s)" % BATCH_JOBS)
+
+    parser.add_option(
+        '--connect',
+        dest='connect',
+        metavar='SOCKET',
+        help="Have the virtualenv server on the Unix socket SOCKET (see "
+        "--serve) create the environment, with its Python")
+
+    parser.add_option(
+        '--log-file',
+        dest='log_file',
+        metavar='FILE',
+        help="Append the complete output of the commands virtualenv runs "
+        "(of which only the last %s lines are shown should one fail) to "
+        "FILE" % OUTPUT_TAIL_LINES)
+
+    parser.add_option(
+        '--timings',
+        dest='timings',
+        metavar='FILE',
+        help="Write how long each step of creating the environment took, "
+        "and how many files it touched, as JSON to FILE ('-' for stdout); "
+        "with --connect, one line for each environment")
+
     parser.add_option(
         '--relocatable',
         dest='relocatable',
@@ -362,18 +932,51 @@ def main():
         help='Make an EXISTING virtualenv environment relocatable.  '
         'This fixes up scripts and makes all .pth files relative')
 
+    parser.add_option(
+        '--dry-run',
+        dest='dry_run',
+        action='store_true',
+        help="With --relocatable, only report which files would be changed")
+
+    parser.add_option(
+        '--merge-pth',
+        dest='merge_pth',
+        action='store_true',
+        help='Merge the .pth files of an EXISTING virtualenv environment '
+        'into the single file that its site.py reads at startup.  This '
+        'also happens on the first start after site-packages changes, '
+        'if the environment is writable')
+
+    parser.add_option(
+        '--index-modules',
+        dest='index_modules',
+        action='store_true',
+        help='Record where each top-level module on the sys.path of an '
+        'EXISTING virtualenv environment lives, so that imports can go '
+        'straight to it.  Re-run this after installing packages')
+
     if 'extend_parser' in globals():
         extend_parser(parser)
 
     options, args = parser.parse_args()
 
-    global logger
+    global logger, timings
 
     if 'adjust_options' in globals():
         adjust_options(options, args)
 
     verbosity = options.verbose - options.quiet
-    logger = Logger([(Logger.level_for_integer(2-verbosity), sys.stdout)])
+    level = Logger.level_for_integer(2-verbosity)
+    logger = Logger([(level, sys.stdout)])
+
+    if options.no_cache:
+        CACHE_DIR = None
+
+    if options.log_file:
+        LOG_FILE = os.path.abspath(options.log_file)
+
+    if options.timings:
+        timings = Timings(enabled=True)
 
     if options.python and not os.environ.get('VIRTUALENV_INTERPRETER_RUNNING'):
         env = os.environ.copy()
@@ -384,21 +987,37 @@ def main():
             logger.notify('Running virtualenv with interpreter %s' % interpreter)
             env['VIRTUALENV_INTERPRETER_RUNNING'] = 'true'
             file = __file__
-            if file.endswith('.pyc'):
+            if file.endswith('.pyc') and os.path.exists(file[:-1]):
                 file = file[:-1]
             os.execvpe(interpreter, [interpreter, file] + sys.argv[1:], env)
 
+    if options.lazy_pth_imports:
+        lazy_pth_imports = options.eager_pth
+    else:
+        lazy_pth_imports = None
+    kw = dict(site_packages=not options.no_site_packages, clear=options.clear,
+              unzip_setuptools=options.unzip_setuptools,
+              lazy_pth_imports=lazy_pth_imports,
+              precompile=options.precompile, jobs=options.jobs,
+              python_link=options.python_link, symlink=options.symlink,
+              trace_modules=options.trace_modules)
+
+    if options.serve:
+        serve(options.serve, kw, jobs=options.jobs)
+        return
+
     if not args:
         print 'You must provide a DEST_DIR'
         parser.print_help()
         sys.exit(2)
-    if len(args) > 1:
+    if len(args) > 1 and not (options.batch or options.connect):
         print 'There must be only one argument: DEST_DIR (you gave %s)' % (
             ' '.join(args))
         parser.print_help()
         sys.exit(2)
 
     home_dir = args[0]
+    home_dirs = args
 
     if os.environ.get('WORKING_ENV'):
         logger.fatal('ERROR: you cannot run virtualenv while in a workingenv')
@@ -413,17 +1032,106 @@ def main():
         logger.warn('%s is set; this can cause problems creating environments' % name)
 
     if options.relocatable:
-        make_environment_relocatable(home_dir)
+        make_environment_relocatable(home_dir, dry_run=options.dry_run,
+                                     jobs=options.jobs)
+        if options.timings:
+            timings.write(options.timings, home_dir=home_dir)
+        return
+
+    if options.merge_pth:
+        merge_pth_files(home_dir)
         return
 
-    create_environment(home_dir, site_packages=not options.no_site_packages, clear=options.clear,
-                       unzip_setuptools=options.unzip_setuptools)
+    if options.index_modules:
+        build_module_index(home_dir)
+        return
+
+    if options.refresh_bytecode:
+        compile_environment(home_dir, jobs=options.jobs)
+        return
+
+    if options.template:
+        for home_dir in home_dirs:
+            clone_environment(options.template, home_dir)
+            if 'after_install' in globals():
+                after_install(options, home_dir)
+        return
+
+    if options.connect:
+        failed = 0
+        # One JSON object per environment
+        append_timings = False
+        for home_dir in home_dirs:
+            status, seconds, phases = request_environment(
+                options.connect, os.path.abspath(home_dir), kw, level)
+            if status:
+                logger.fatal('ERROR: could not create %s (status %s)'
+                             % (home_dir, status))
+                failed += 1
+                continue
+            logger.notify('Created %s in %.2f seconds' % (home_dir, seconds))
+            for phase in phases:
+                logger.info('  %s: %.3f seconds'
+                            % (phase['name'], phase['seconds']))
+            if options.timings:
+                write_timings(options.timings, seconds, phases,
+                              append=append_timings, home_dir=home_dir)
+                append_timings = True
+            if 'after_install' in globals():
+                after_install(options, home_dir)
+        if failed:
+            sys.exit(3)
+        return
+
+    if options.batch:
+        results = create_environments(home_dirs, **kw)
+        failed = 0
+        for result in results:
+            sys.stdout.write(result['output'])
+            if result['error']:
+                logger.fatal('ERROR: could not create %s: %s'
+                             % (result['home_dir'], result['error']))
+                failed += 1
+            else:
+                logger.notify('Created %s in %.2f seconds'
+                              % (result['home_dir'], result['seconds']))
+                if 'after_install' in globals():
+                    after_install(options, result['home_dir'])
+        if failed:
+            sys.exit(3)
+        return
+    create_environment(home_dir, **kw)
+    if options.timings:
+        timings.write(options.timings, home_dir=home_dir)
     if 'after_install' in globals():
         after_install(options, home_dir)
 
+# How many of the last output lines call_subprocess() keeps to show
+# when a command fails
+OUTPUT_TAIL_LINES = 200
+
+# How many lines read_lines() reads ahead of its consumer before the
+# command has to wait for it
+OUTPUT_QUEUE_LINES = 1000
+
+# Where call_subprocess() appends the complete output of commands by
+# default (see --log-file)
+LOG_FILE = None
+
 def call_subprocess(cmd, show_stdout=True,
                     filter_stdout=None, cwd=None,
-                    raise_on_returncode=True, extra_env=None):
+                    raise_on_returncode=True, extra_env=None,
+                    log_file=None, tail_lines=OUTPUT_TAIL_LINES):
+    """
+    Runs ``cmd``.  Unless ``show_stdout``, its output is logged line by
+    line (at the level ``filter_stdout(line)`` returns, if given), and
+    only the last ``tail_lines`` lines are kept, to be shown should
+    the command fail.  The complete output is appended to the file
+    named by ``log_file`` (default ``LOG_FILE``), if any.
+
+    The output is read by a thread of its own, so that a slow
+    ``filter_stdout`` never holds up the command.
+    """
     cmd_parts = []
     for part in cmd:
         if len(part) > 40:
@@ -450,15 +1158,21 @@ def call_subprocess(cmd, show_stdout=True,
         logger.fatal(
             "Error %s while executing command %s" % (e, cmd_desc))
         raise
-    all_output = []
+    tail = []
+    line_count = 0
+    if log_file is None:
+        log_file = LOG_FILE
     if stdout is not None:
-        stdout = proc.stdout
-        while 1:
-            line = stdout.readline()
-            if not line:
-                break
+        log = None
+        if log_file:
+            log = open(log_file, 'ab')
+            log.write('Running command %s\n' % cmd_desc)
+        for line in read_lines(proc.stdout, log):
             line = line.rstrip()
-            all_output.append(line)
+            line_count += 1
+            tail.append(line)
+            if len(tail) > tail_lines:
+                del tail[0]
             if filter_stdout:
                 level = filter_stdout(line)
                 if isinstance(level, tuple):
@@ -473,9 +1187,15 @@ def call_subprocess(cmd, show_stdout=True,
     proc.wait()
     if proc.returncode:
         if raise_on_returncode:
-            if all_output:
-                logger.notify('Complete output from command %s:' % cmd_desc)
-                logger.notify('\n'.join(all_output) + '\n----------------------------------------')
+            if tail:
+                if line_count > len(tail):
+                    logger.notify('Last %s of %s lines of output from command %s:'
+                                  % (len(tail), line_count, cmd_desc))
+                else:
+                    logger.notify('Complete output from command %s:' % cmd_desc)
+                if log_file:
+                    logger.notify('(all of it is in %s)' % log_file)
+                logger.notify('\n'.join(tail) + '\n----------------------------------------')
             raise OSError(
                 "Command %s failed with error code %s"
                 % (cmd_desc, proc.returncode))
@@ -485,8 +1205,60 @@ def call_subprocess(cmd, show_stdout=True,
                 % (cmd_desc, proc.returncode))
 
 
+def read_lines(stdout, log=None):
+    """
+    Yields the lines of the pipe ``stdout``, which a thread reads (and
+    writes to the open file ``log``, if any, closing it at the end) as
+    soon as the other end writes them, up to ``OUTPUT_QUEUE_LINES``
+    ahead of the consumer.
+    """
+    try:
+        import threading, Queue
+    except ImportError:
+        threading = None
+    if threading is None:
+        while 1:
+            line = stdout.readline()
+            if not line:
+                break
+            if log is not None:
+                log.write(line)
+            yield line
+        if log is not None:
+            log.close()
+        return
+    # Bounded, so that a slow consumer holds up the command rather
+    # than have all of its output pile up here
+    lines = Queue.Queue(OUTPUT_QUEUE_LINES)
+    def read():
+        try:
+            while 1:
+                line = stdout.readline()
+                if not line:
+                    break
+                if log is not None:
+                    log.write(line)
+                lines.put(line)
+        finally:
+            if log is not None:
+                log.close()
+            # Tells the consumer to stop
+            lines.put('')
+    reader = threading.Thread(target=read)
+    reader.setDaemon(True)
+    reader.start()
+    while 1:
+        line = lines.get()
+        if not line:
+            break
+        yield line
+    reader.join()
+
 def create_environment(home_dir, site_packages=True, clear=False,
-                       unzip_setuptools=False):
+                       unzip_setuptools=False, index_modules=False,
+                       lazy_pth_imports=None, precompile=False, jobs=None,
+                       test_executable=True, python_link='copy',
+                       symlink=True, trace_modules=False):
     """
     Creates a new environment in ``home_dir``.
 
@@ -495,18 +1267,516 @@ def create_environment(home_dir, site_packages=True, clear=False,
 
     If ``clear`` is true (default False) then the environment will
     first be cleared.
+
+    If ``lazy_pth_imports`` is a list (default None) then the
+    ``import`` lines of ``.pth`` files will only be run once a module
+    that they name is imported, except for those of the ``.pth``
+    files, or starting with the text, given in the list.
+
+    If ``index_modules`` is true (default False) then a module
+    location index is built once the environment is complete (see
+    ``build_module_index()``).
+
+    If ``precompile`` is true (default False) then all Python sources
+    of the environment are compiled to bytecode, ``jobs`` files at a
+    time (see ``compile_environment()``).
+
+    If ``python_link`` is ``'hardlink'`` (default ``'copy'``) then
+    the interpreter executable is hard linked rather than copied into
+    the environment where possible, and its second name (``python``)
+    is a symlink to it.
+
+    If ``symlink`` is false (default True) then the standard library
+    modules the environment needs are copied into it rather than
+    symlinked.
+
+    If ``trace_modules`` is true (default False) then those modules
+    are the ones the interpreter is seen to import as it starts up
+    (see ``bootstrap_modules()``) rather than ``REQUIRED_MODULES``.
+
+    If ``test_executable`` is false (default True) then the new
+    interpreter is not checked to report the right ``sys.prefix``.
     """
+    timings.reset()
     home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    timings.phase('path_locations')
+
+    # An existing environment made the same way is only brought back
+    # to what its manifest records:
+    key = manifest_key(site_packages, unzip_setuptools, index_modules,
+                       lazy_pth_imports, precompile, python_link, symlink,
+                       trace_modules)
+    manifest = None
+    if not clear:
+        manifest = load_manifest(home_dir)
+    if manifest is not None and manifest['key'] == key:
+        redo = manifest_drift(home_dir, manifest)
+        timings.phase('check_manifest')
+        if not redo:
+            logger.notify('Environment %s is up to date' % home_dir)
+            return
+        logger.notify('Redoing %s in %s (they have changed)'
+                      % (', '.join(redo), home_dir))
+    else:
+        redo = MANIFEST_STEPS
+
+    # What each step writes is collected for the manifest
+    global written_paths
+    written = {}
+    try:
+        if 'python' in redo:
+            written_paths = written['python'] = {}
+            py_executable = install_python(
+                home_dir, lib_dir, inc_dir, bin_dir, 
+                site_packages=site_packages, clear=clear,
+                lazy_pth_imports=lazy_pth_imports, jobs=jobs,
+                test_executable=test_executable, python_link=python_link,
+                symlink=symlink, trace_modules=trace_modules)
+        else:
+            py_executable = join(home_dir, manifest['py_executable'])
+
+        if 'distutils' in redo:
+            written_paths = written['distutils'] = {}
+            install_distutils(lib_dir, home_dir)
+            timings.phase('install_distutils')
+
+        if 'setuptools' in redo:
+            written_paths = written['setuptools'] = {}
+            install_setuptools(py_executable, unzip=unzip_setuptools,
+                               lib_dir=lib_dir)
+            timings.phase('install_setuptools')
+
+        if 'activate' in redo:
+            written_paths = written['activate'] = {}
+            install_activate(home_dir, bin_dir)
+            timings.phase('install_activate')
+    finally:
+        written_paths = None
+
+    if index_modules:
+        build_module_index(home_dir)
+        timings.phase('build_module_index')
 
-    py_executable = install_python(
-        home_dir, lib_dir, inc_dir, bin_dir, 
-        site_packages=site_packages, clear=clear)
+    if precompile:
+        compile_environment(home_dir, jobs=jobs)
+        timings.phase('compile_environment')
 
-    install_distutils(lib_dir, home_dir)
+    save_manifest(home_dir, key, py_executable, written, manifest)
+    timings.phase('save_manifest')
+
+def create_environments(home_dirs, jobs=None, **kw):
+    """
+    Creates a new environment in each of ``home_dirs``, taking the
+    same keyword arguments as ``create_environment()``.
+
+    The first environment is created in this process, and the
+    interpreter is only tested in that one; what that leaves behind
+    (the probed facts about the interpreter, the decoded support files)
+    is then shared by the others, which are created ``jobs`` (default
+    ``BATCH_JOBS``) at a time, each in a process forked from this one
+    where ``os.fork()`` exists.
+
+    Returns one dictionary per environment, in the order of
+    ``home_dirs``, with the keys ``home_dir``, ``seconds`` (how long
+    creating it took), ``error`` (None or a one-line description) and
+    ``output`` (what would have been logged to stdout).
+    """
+    if not home_dirs:
+        return []
+    results = [_create_capturing(home_dirs[0], kw)]
+    if results[0]['error']:
+        for home_dir in home_dirs[1:]:
+            results.append(dict(
+                home_dir=home_dir, seconds=0.0, output='',
+                error='Not created, because creating %s failed'
+                % home_dirs[0]))
+        return results
+    kw['test_executable'] = False
+    if not hasattr(os, 'fork'):
+        for home_dir in home_dirs[1:]:
+            results.append(_create_capturing(home_dir, kw))
+        return results
+    results.extend(_create_forked(home_dirs[1:], kw, jobs or BATCH_JOBS))
+    return results
+
+def _create_forked(home_dirs, kw, jobs):
+    """
+    Runs ``create_environment(home_dir, **kw)`` for each of
+    ``home_dirs`` in a child process of its own, ``jobs`` at a time,
+    and returns what ``_create_capturing()`` returned in each child.
+    The children are forked from this, the only thread, and their
+    pipes are read with ``select()``, as forking while other threads
+    hold locks (the logging's, a Queue's) would leave those locks held
+    in the child.
+    """
+    import time, marshal, select
+    results = [None] * len(home_dirs)
+    pending = range(len(home_dirs))
+    pending.reverse()
+    # The read end of each child's pipe -> (index, pid, start, chunks)
+    running = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            index = pending.pop()
+            read_fd, write_fd = os.pipe()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if not pid:
+                try:
+                    try:
+                        os.close(read_fd)
+                        data = marshal.dumps(
+                            _create_capturing(home_dirs[index], kw))
+                        while data:
+                            data = data[os.write(write_fd, data):]
+                    except:
+                        os._exit(1)
+                finally:
+                    os._exit(0)
+            os.close(write_fd)
+            running[read_fd] = (index, pid, time.time(), [])
+        ready = select.select(running.keys(), [], [])[0]
+        for read_fd in ready:
+            index, pid, start, chunks = running[read_fd]
+            chunk = os.read(read_fd, 65536)
+            if chunk:
+                chunks.append(chunk)
+                continue
+            os.close(read_fd)
+            del running[read_fd]
+            pid, status = os.waitpid(pid, 0)
+            try:
+                results[index] = marshal.loads(''.join(chunks))
+            except (EOFError, ValueError, TypeError):
+                results[index] = dict(
+                    home_dir=home_dirs[index], seconds=time.time() - start,
+                    output='', error='Child process exited with status %s'
+                    % status)
+    return results
+
+def _create_capturing(home_dir, kw):
+    import time
+    from StringIO import StringIO
+    global logger
+    saved_stdout, saved_logger = sys.stdout, logger
+    sys.stdout = output = StringIO()
+    consumers = []
+    for level, consumer in logger.consumers:
+        if consumer is saved_stdout:
+            consumer = output
+        consumers.append((level, consumer))
+    logger = Logger(consumers)
+    error = None
+    start = time.time()
+    try:
+        try:
+            create_environment(home_dir, **kw)
+        except SystemExit, e:
+            error = 'Exited with status %s' % e.code
+        except Exception, e:
+            error = '%s: %s' % (e.__class__.__name__, e)
+    finally:
+        sys.stdout, logger = saved_stdout, saved_logger
+    return dict(home_dir=home_dir, seconds=time.time() - start,
+                error=error, output=output.getvalue())
+
+def serve(socket_path, kw=None, jobs=None):
+    """
+    Creates environments for the clients that connect to the Unix
+    socket ``socket_path`` (see ``request_environment()``), each in a
+    child process forked for it, up to ``jobs`` (default
+    ``BATCH_JOBS``) at a time.  An environment is created with the
+    ``create_environment()`` keyword arguments ``kw`` and thrown away
+    first, so that importing this script, decoding its support files,
+    probing the interpreter and unpacking the Setuptools egg are all
+    done once, here, rather than for every request.
+    """
+    import SocketServer, socket, signal, tempfile
+    if not hasattr(SocketServer, 'UnixStreamServer') or not hasattr(os, 'fork'):
+        logger.fatal('ERROR: serving needs Unix sockets and os.fork()')
+        sys.exit(3)
+    if os.path.exists(socket_path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                sock.connect(socket_path)
+            except socket.error:
+                # Left behind by a server that is gone
+                os.unlink(socket_path)
+            else:
+                logger.fatal('ERROR: a server is already listening on %s'
+                             % socket_path)
+                sys.exit(3)
+        finally:
+            sock.close()
+    warm_dir = tempfile.mkdtemp(prefix='virtualenv-serve-')
+    try:
+        result = _create_capturing(join(warm_dir, 'env'), kw or {})
+    finally:
+        shutil.rmtree(warm_dir)
+    if result['error']:
+        sys.stdout.write(result['output'])
+        logger.fatal('ERROR: could not create an environment: %s'
+                     % result['error'])
+        sys.exit(3)
+    logger.info('Created a first environment in %.2f seconds'
+                % result['seconds'])
+
+    class Handler(SocketServer.StreamRequestHandler):
+        def handle(self):
+            _serve_request(self.rfile, self.wfile, self.connection)
+
+    class Server(SocketServer.ForkingMixIn, SocketServer.UnixStreamServer):
+        max_children = jobs or BATCH_JOBS
+
+    # Only this user may connect: the socket is created with mode 0600,
+    # rather than changed to it once others could have connected
+    old_umask = os.umask(0077)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(old_umask)
+    # Remove the socket on kill as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        logger.notify('Creating environments for clients of %s' % socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+def _serve_request(rfile, wfile, connection):
+    """
+    Creates the environment a client asked for, in a child process of
+    ``serve()``.  Everything written to stdout and stderr, including by
+    subprocesses, goes to the client, followed by a NUL character and
+    the marshalled ``(status, seconds, phases)``.
+    """
+    import time, marshal, signal
+    global logger, timings
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        request = marshal.loads(rfile.read())
+    except (EOFError, ValueError, TypeError):
+        # Not a client; serve() checking whether the socket is in use
+        return
+    home_dir = request['home_dir']
+    saved_stdout, saved_logger = sys.stdout, logger
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = [os.dup(1), os.dup(2)]
+    os.dup2(connection.fileno(), 1)
+    os.dup2(connection.fileno(), 2)
+    sys.stdout = wfile
+    logger = Logger([(request['level'], wfile)])
+    timings = Timings(enabled=True)
+    status = 0
+    start = time.time()
+    try:
+        try:
+            create_environment(home_dir, **request['kw'])
+        except SystemExit, e:
+            if isinstance(e.code, int):
+                status = e.code
+            elif e.code is not None:
+                logger.fatal(str(e.code))
+                status = 1
+        except:
+            import traceback
+            traceback.print_exc(file=wfile)
+            status = 1
+        seconds = time.time() - start
+        wfile.write('\0' + marshal.dumps((status, seconds, timings.phases)))
+    finally:
+        for fd, saved_fd in zip((1, 2), saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        sys.stdout, logger = saved_stdout, saved_logger
+    if status:
+        logger.warn('Could not create %s (status %s)' % (home_dir, status))
+    else:
+        logger.notify('Created %s in %.2f seconds' % (home_dir, seconds))
 
-    install_setuptools(py_executable, unzip=unzip_setuptools)
+def request_environment(socket_path, home_dir, kw, level=Logger.NOTIFY):
+    """
+    Has the server on the Unix socket ``socket_path`` (see ``serve()``)
+    run ``create_environment(home_dir, **kw)``, showing what it logs at
+    ``level`` and above as it goes.  ``home_dir`` should be absolute,
+    as the server does not share the current directory.  Returns
+    ``(status, seconds, phases)``, where ``status`` is 0 if the
+    environment was created and ``phases`` are its ``Timings``.
+    """
+    import socket, marshal
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error, e:
+            logger.fatal('ERROR: cannot connect to the virtualenv server on %s: %s'
+                         % (socket_path, e))
+            sys.exit(3)
+        sock.sendall(marshal.dumps(dict(
+            home_dir=home_dir, kw=kw, level=level)))
+        sock.shutdown(socket.SHUT_WR)
+        result = None
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            if result is not None:
+                result.append(data)
+                continue
+            pos = data.find('\0')
+            if pos == -1:
+                sys.stdout.write(data)
+            else:
+                sys.stdout.write(data[:pos])
+                result = [data[pos+1:]]
+            sys.stdout.flush()
+    finally:
+        sock.close()
+    if result is None:
+        logger.fatal('ERROR: the virtualenv server stopped before it was done')
+        return 1, 0, []
+    return marshal.loads(''.join(result))
 
+def clone_environment(template_dir, home_dir):
+    """
+    Creates a new environment in ``home_dir`` as a copy of the
+    existing environment ``template_dir``, instead of building it from
+    scratch.  Files are cloned with copy-on-write reflinks where the
+    filesystem supports them, hard linked where it does not, and
+    copied otherwise; the files that name the template's location
+    (script shebangs, ``.pth`` and ``.egg-link`` files) are rewritten
+    for ``home_dir``, and the activate scripts are written anew.
+
+    Note that hard linked files are shared with the template, so they
+    must be replaced rather than edited in place, as ``writefile()``
+    and ``rewrite_file()`` do.
+    """
+    import time
+    start = time.time()
+    template_dir = os.path.abspath(template_dir)
+    template_lib_dir, template_bin_dir = path_locations(template_dir)[1::2]
+    if not os.path.exists(join(template_lib_dir, 'orig-prefix.txt')):
+        logger.fatal('ERROR: %s is not a virtualenv environment' % template_dir)
+        sys.exit(3)
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    new_dir = os.path.abspath(home_dir)
+    # Files that hold paths into the template: the caches of site.py,
+    # which the new environment rebuilds as it starts, and its manifest
+    skip = {join(template_lib_dir, 'sys-path-snapshot.dat'): None,
+            join(template_lib_dir, 'module-index.dat'): None,
+            join(template_lib_dir, 'install-manifest.dat'): None}
+    for name in ACTIVATE_SCRIPTS:
+        skip[join(template_bin_dir, name)] = None
+    # Shrinks as cloning methods turn out not to work here:
+    methods = ['reflink', 'hardlink', 'copy']
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(template_dir):
+        dest_dirpath = new_dir + dirpath[len(template_dir):]
+        mkdir(dest_dirpath)
+        for name in dirnames + filenames:
+            src = join(dirpath, name)
+            dest = join(dest_dirpath, name)
+            if src in skip:
+                continue
+            if os.path.islink(src):
+                # os.walk() does not descend into these, so this
+                # covers symlinked directories too
+                if os.path.lexists(dest):
+                    logger.debug('File %s already exists', dest)
+                    continue
+                target = os.readlink(src)
+                if target == template_dir or target.startswith(
+                    template_dir + os.sep):
+                    target = new_dir + target[len(template_dir):]
+                os.symlink(target, dest)
+            elif name in dirnames:
+                continue
+            elif os.path.exists(dest):
+                logger.debug('File %s already exists', dest)
+                continue
+            elif ((dirpath == template_bin_dir and is_script(src))
+                  or name.endswith('.pth') or name.endswith('.egg-link')):
+                clone_file_rewriting(src, dest, template_dir, new_dir)
+            else:
+                clone_file(src, dest, methods)
+            count += 1
     install_activate(home_dir, bin_dir)
+    logger.notify('Cloned %s files of %s into %s in %.3f seconds (%s)'
+                  % (count, template_dir, home_dir, time.time() - start,
+                     methods[0]))
+
+def is_script(filename):
+    f = open(filename, 'rb')
+    start = f.read(2)
+    f.close()
+    return start == '#!'
+
+def clone_file(src, dest, methods):
+    """
+    Clones the file ``src`` to ``dest`` with the first of ``methods``
+    ('reflink', 'hardlink' or 'copy') that works, dropping the
+    methods that fail from the list so that later files do not try
+    them again.
+    """
+    while True:
+        method = methods[0]
+        try:
+            if method == 'reflink':
+                reflink(src, dest)
+            elif method == 'hardlink':
+                os.link(src, dest)
+            else:
+                shutil.copy2(src, dest)
+            timings.count(method)
+            return
+        except (IOError, OSError, AttributeError), e:
+            if method == 'copy':
+                raise
+            logger.info('Cannot %s %s (%s), falling back to %s'
+                        % (method, src, e, methods[1]))
+            if os.path.exists(dest):
+                os.unlink(dest)
+            del methods[0]
+
+# ioctl(2) request for a copy-on-write clone of a whole file on Linux
+# (btrfs, XFS and others), from <linux/fs.h>
+FICLONE = 0x40049409
+
+def reflink(src, dest):
+    import fcntl
+    if not sys.platform.startswith('linux'):
+        raise OSError('reflinks are only supported on Linux')
+    src_f = open(src, 'rb')
+    try:
+        dest_f = open(dest, 'wb')
+        try:
+            fcntl.ioctl(dest_f.fileno(), FICLONE, src_f.fileno())
+        finally:
+            dest_f.close()
+    finally:
+        src_f.close()
+    shutil.copystat(src, dest)
+
+def clone_file_rewriting(src, dest, template_dir, new_dir):
+    """Copies ``src`` to ``dest``, replacing any mention of
+    ``template_dir`` with ``new_dir``"""
+    f = open(src, 'rb')
+    content = f.read()
+    f.close()
+    if template_dir in content:
+        logger.info('Rewriting %s' % dest)
+        content = content.replace(template_dir, new_dir)
+    f = open(dest, 'wb')
+    f.write(content)
+    f.close()
+    shutil.copymode(src, dest)
 
 def path_locations(home_dir):
     """Return the path locations for the environment (where libraries are,
@@ -540,7 +1810,9 @@ def path_locations(home_dir):
         bin_dir = join(home_dir, 'bin')
     return home_dir, lib_dir, inc_dir, bin_dir
 
-def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
+def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear,
+                   lazy_pth_imports=None, jobs=None, test_executable=True,
+                   python_link='copy', symlink=True, trace_modules=False):
     """Install just the base environment, no distutils patches etc"""
     if sys.executable.startswith(bin_dir):
         print 'Please use the *system* python to run this script'
@@ -564,22 +1836,29 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
         stdlib_dirs.append(join(os.path.dirname(stdlib_dirs[0]), 'DLLs'))
     elif sys.platform == 'darwin':
         stdlib_dirs.append(join(stdlib_dirs[0], 'site-packages'))
+    if trace_modules:
+        required_modules = bootstrap_modules(stdlib_dirs)
+    else:
+        required_modules = REQUIRED_MODULES
     for stdlib_dir in stdlib_dirs:
         if not os.path.isdir(stdlib_dir):
             continue
-        if hasattr(os, 'symlink'):
+        if symlink and hasattr(os, 'symlink'):
             logger.info('Symlinking Python bootstrap modules')
         else:
             logger.info('Copying Python bootstrap modules')
         logger.indent += 2
         try:
-            for fn in os.listdir(stdlib_dir):
-                if fn != 'site-packages' and os.path.splitext(fn)[0] in REQUIRED_MODULES:
-                    copyfile(join(stdlib_dir, fn), join(lib_dir, fn))
+            copyfiles([ (join(stdlib_dir, fn), join(lib_dir, fn))
+                        for fn in list_stdlib_dir(stdlib_dir)
+                        if fn != 'site-packages'
+                        and os.path.splitext(fn)[0] in required_modules ],
+                      symlink=symlink, jobs=jobs)
         finally:
             logger.indent -= 2
+    timings.phase('install_python.modules')
     mkdir(join(lib_dir, 'site-packages'))
-    writefile(join(lib_dir, 'site.py'), SITE_PY)
+    writefile(join(lib_dir, 'site.py'), support_file('site.py'))
     writefile(join(lib_dir, 'orig-prefix.txt'), prefix)
     site_packages_filename = join(lib_dir, 'no-global-site-packages.txt')
     if not site_packages:
@@ -588,12 +1867,22 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
         if os.path.exists(site_packages_filename):
             logger.info('Deleting %s' % site_packages_filename)
             os.unlink(site_packages_filename)
+    lazy_pth_filename = join(lib_dir, 'lazy-pth-imports.txt')
+    if lazy_pth_imports is not None:
+        writefile(lazy_pth_filename, ''.join(
+            [ '%s\n' % eager for eager in lazy_pth_imports ]))
+    elif os.path.exists(lazy_pth_filename):
+        logger.info('Deleting %s' % lazy_pth_filename)
+        os.unlink(lazy_pth_filename)
+
+    timings.phase('install_python.files')
 
     stdinc_dir = join(prefix, 'include', py_version)
     if os.path.exists(stdinc_dir):
-        copyfile(stdinc_dir, inc_dir)
+        copyfile(stdinc_dir, inc_dir, symlink=symlink)
     else:
         logger.debug('No include dir %s' % stdinc_dir)
+    timings.phase('install_python.include')
 
     if sys.exec_prefix != prefix:
         if sys.platform == 'win32':
@@ -602,8 +1891,9 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
             exec_dir = join(sys.exec_prefix, 'Lib')
         else:
             exec_dir = join(sys.exec_prefix, 'lib', py_version)
-        for fn in os.listdir(exec_dir):
-            copyfile(join(exec_dir, fn), join(lib_dir, fn))
+        copyfiles([ (join(exec_dir, fn), join(lib_dir, fn))
+                    for fn in os.listdir(exec_dir) ],
+                  symlink=symlink, jobs=jobs)
     
     if is_jython:
         # Jython has either jython-dev.jar and javalib/ dir, or just
@@ -611,13 +1901,14 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
         for name in 'jython-dev.jar', 'javalib', 'jython.jar':
             src = join(prefix, name)
             if os.path.exists(src):
-                copyfile(src, join(home_dir, name))
+                copyfile(src, join(home_dir, name), symlink=symlink)
         # XXX: registry should always exist after Jython 2.5rc1
         src = join(prefix, 'registry')
         if os.path.exists(src):
             copyfile(src, join(home_dir, 'registry'), symlink=False)
         copyfile(join(prefix, 'cachedir'), join(home_dir, 'cachedir'),
                  symlink=False)
+    timings.phase('install_python.exec_prefix')
 
     mkdir(bin_dir)
     py_executable = join(bin_dir, os.path.basename(sys.executable))
@@ -630,20 +1921,59 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
 
     logger.notify('New %s executable in %s', expected_exe, py_executable)
     if sys.executable != py_executable:
-        ## FIXME: could I just hard link?
         executable = sys.executable
         if sys.platform == 'cygwin' and os.path.exists(executable + '.exe'):
             # Cygwin misreports sys.executable sometimes
             executable += '.exe'
             py_executable += '.exe'
             logger.info('Executable actually exists in %s' % executable)
-        shutil.copyfile(executable, py_executable)
-        make_exe(py_executable)
+        linked = False
+        if python_link == 'hardlink' and 'Python.framework' in prefix:
+            # The framework executable gets patched in place below
+            logger.info('Copying rather than linking the framework executable')
+        elif python_link == 'hardlink' and hasattr(os, 'link'):
+            # Not a symlink: Python finds its prefix from the real
+            # location of its executable, which has to be in bin_dir.
+            # Link the file itself, not the symlink to it (if any).
+            real_executable = os.path.realpath(executable)
+            try:
+                if (os.path.exists(py_executable)
+                    and not os.path.islink(py_executable)
+                    and os.path.samefile(real_executable, py_executable)):
+                    logger.info('%s is already linked to %s'
+                                % (py_executable, executable))
+                else:
+                    if os.path.lexists(py_executable):
+                        os.unlink(py_executable)
+                    os.link(real_executable, py_executable)
+                    timings.count('hardlink')
+                    logger.info('Hard linked %s to %s'
+                                % (py_executable, executable))
+                record_written(py_executable)
+                linked = True
+            except OSError, e:
+                logger.info('Cannot hard link %s (%s), copying it'
+                            % (executable, e))
+        if not linked:
+            # Always copied, so that re-running virtualenv brings in an
+            # updated interpreter; but a hard link left by
+            # --python-link=hardlink is removed first, as writing into
+            # it would write into the interpreter it is linked to.
+            if (os.path.exists(py_executable)
+                and os.stat(py_executable).st_nlink > 1):
+                os.unlink(py_executable)
+            timings.count('copy')
+            shutil.copyfile(executable, py_executable)
+            make_exe(py_executable)
+            record_written(py_executable)
         if sys.platform == 'win32' or sys.platform == 'cygwin':
             pythonw = os.path.join(os.path.dirname(sys.executable), 'pythonw.exe')
             if os.path.exists(pythonw):
                 logger.info('Also created pythonw.exe')
-                shutil.copyfile(pythonw, os.path.join(os.path.dirname(py_executable), 'pythonw.exe'))
+                new_pythonw = os.path.join(os.path.dirname(py_executable),
+                                           'pythonw.exe')
+                shutil.copyfile(pythonw, new_pythonw)
+                record_written(new_pythonw)
                 
     if os.path.splitext(os.path.basename(py_executable))[0] != expected_exe:
         secondary_exe = os.path.join(os.path.dirname(py_executable),
@@ -657,8 +1987,16 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
                         % (expected_exe, secondary_exe, py_executable))
         else:
             logger.notify('Also creating executable in %s' % secondary_exe)
-            shutil.copyfile(sys.executable, secondary_exe)
-            make_exe(secondary_exe)
+            if python_link == 'hardlink' and hasattr(os, 'symlink'):
+                # Unlike the executable itself, this can be a symlink
+                # because it resolves to a file in bin_dir
+                timings.count('symlink')
+                os.symlink(os.path.basename(py_executable), secondary_exe)
+            else:
+                timings.count('copy')
+                shutil.copyfile(sys.executable, secondary_exe)
+                make_exe(secondary_exe)
+            record_written(secondary_exe)
     
     if 'Python.framework' in prefix:
         logger.debug('MacOSX Python framework detected')
@@ -705,35 +2043,53 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
             if os.path.exists(pth):
                 os.unlink(pth)
             os.symlink('python', pth)
+            record_written(pth)
         else:
             # reverse symlinking python -> pythonX.Y (with --python)
             pth = join(bin_dir, 'python')
             if os.path.exists(pth):
                 os.unlink(pth)
             os.symlink(os.path.basename(py_executable), pth)
+            record_written(pth)
+
+    timings.phase('install_python.executable')
 
     if sys.platform == 'win32' and ' ' in py_executable:
         # There's a bug with subprocess on Windows when using a first
         # argument that has a space in it.  Instead we have to quote
         # the value:
         py_executable = '"%s"' % py_executable
-    cmd = [py_executable, '-c', 'import sys; print sys.prefix']
-    logger.info('Testing executable with %s %s "%s"' % tuple(cmd))
-    proc = subprocess.Popen(cmd,
-                            stdout=subprocess.PIPE)
-    proc_stdout, proc_stderr = proc.communicate()
-    proc_stdout = os.path.normcase(os.path.abspath(proc_stdout.strip()))
-    if proc_stdout != os.path.normcase(os.path.abspath(home_dir)):
-        logger.fatal(
-            'ERROR: The executable %s is not functioning' % py_executable)
-        logger.fatal(
-            'ERROR: It thinks sys.prefix is %r (should be %r)'
-            % (proc_stdout, os.path.normcase(os.path.abspath(home_dir))))
-        logger.fatal(
-            'ERROR: virtualenv is not compatible with this system or executable')
-        sys.exit(100)
-    else:
-        logger.info('Got sys.prefix result: %r' % proc_stdout)
+    # Environments made the same way have worked with this interpreter
+    # before (the site.py and the way the executable is put in place
+    # are what could break them):
+    import zlib
+    verified = (zlib.crc32(EMBEDDED_FILES['site.py']), python_link,
+                trace_modules)
+    facts = interpreter_facts()
+    if test_executable and facts.get('verified') == verified:
+        logger.info('Not testing executable %s; this interpreter worked before'
+                    % py_executable)
+    elif test_executable:
+        cmd = [py_executable, '-c', 'import sys; print sys.prefix']
+        logger.info('Testing executable with %s %s "%s"' % tuple(cmd))
+        proc = subprocess.Popen(cmd,
+                                stdout=subprocess.PIPE)
+        proc_stdout, proc_stderr = proc.communicate()
+        proc_stdout = os.path.normcase(os.path.abspath(proc_stdout.strip()))
+        if proc_stdout != os.path.normcase(os.path.abspath(home_dir)):
+            logger.fatal(
+                'ERROR: The executable %s is not functioning' % py_executable)
+            logger.fatal(
+                'ERROR: It thinks sys.prefix is %r (should be %r)'
+                % (proc_stdout, os.path.normcase(os.path.abspath(home_dir))))
+            logger.fatal(
+                'ERROR: virtualenv is not compatible with this system or executable')
+            sys.exit(100)
+        else:
+            logger.info('Got sys.prefix result: %r' % proc_stdout)
+            facts['verified'] = verified
+    save_probe_cache()
+    timings.phase('install_python.verify')
 
     pydistutils = os.path.expanduser('~/.pydistutils.cfg')
     if os.path.exists(pydistutils):
@@ -742,15 +2098,19 @@ def install_python(home_dir, lib_dir, inc_dir, bin_dir, site_packages, clear):
     ## FIXME: really this should be calculated earlier
     return py_executable
 
+# Written by install_activate()
+ACTIVATE_SCRIPTS = ['activate', 'activate.bat', 'deactivate.bat',
+                    'activate_this.py', 'activate_this.pyc']
+
 def install_activate(home_dir, bin_dir):
     if sys.platform == 'win32' or is_jython and os._name == 'nt':
-        files = {'activate.bat': ACTIVATE_BAT,
-                 'deactivate.bat': DEACTIVATE_BAT}
+        files = {'activate.bat': support_file('activate.bat'),
+                 'deactivate.bat': support_file('deactivate.bat')}
         if os.environ.get('OS') == 'Windows_NT' and os.environ.get('OSTYPE') == 'cygwin':
-            files['activate'] = ACTIVATE_SH
+            files['activate'] = support_file('activate.sh')
     else:
-        files = {'activate': ACTIVATE_SH}
-    files['activate_this.py'] = ACTIVATE_THIS
+        files = {'activate': support_file('activate.sh')}
+    files['activate_this.py'] = support_file('activate_this.py')
     for name, content in files.items():
         content = content.replace('__VIRTUAL_ENV__', os.path.abspath(home_dir))
         content = content.replace('__VIRTUAL_NAME__', os.path.basename(os.path.abspath(home_dir)))
@@ -764,9 +2124,154 @@ def install_distutils(lib_dir, home_dir):
     ## there's a local distutils.cfg with a prefix setting?
     home_dir = os.path.abspath(home_dir)
     ## FIXME: this is breaking things, removing for now:
-    #distutils_cfg = DISTUTILS_CFG + "\n[install]\nprefix=%s\n" % home_dir
-    writefile(os.path.join(distutils_path, '__init__.py'), DISTUTILS_INIT)
-    writefile(os.path.join(distutils_path, 'distutils.cfg'), DISTUTILS_CFG, overwrite=False)
+    #distutils_cfg = support_file('distutils.cfg') + "\n[install]\nprefix=%s\n" % home_dir
+    writefile(os.path.join(distutils_path, '__init__.py'), support_file('distutils-init.py'))
+    writefile(os.path.join(distutils_path, 'distutils.cfg'), support_file('distutils.cfg'), overwrite=False)
+
+def merge_pth_files(home_dir):
+    """
+    Regenerates ``lib/pythonX.Y/sys-path-snapshot.dat``, into which the
+    environment's ``site.py`` merges the paths and the (compiled)
+    ``import`` lines of all the ``.pth`` files in ``site-packages``.
+    """
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    snapshot = join(lib_dir, 'sys-path-snapshot.dat')
+    if os.path.exists(snapshot):
+        os.unlink(snapshot)
+    py_executable = join(bin_dir, expected_exe)
+    if sys.platform == 'win32' or sys.platform == 'cygwin':
+        py_executable += '.exe'
+    # Simply starting the interpreter writes a new snapshot (unless
+    # PYTHONPATH is set):
+    call_subprocess([py_executable, '-c', 'pass'], show_stdout=False,
+                    extra_env={'PYTHONPATH': ''})
+    if not os.path.exists(snapshot):
+        logger.fatal('ERROR: %s was not written; is %s writable?'
+                     % (snapshot, lib_dir))
+        sys.exit(3)
+    import marshal
+    f = open(snapshot, 'rb')
+    try:
+        snapshot = marshal.load(f)
+    finally:
+        f.close()
+    logger.notify('Merged %s .pth files into %s paths and %s import lines'
+                  % (len(snapshot['pth_files']), len(snapshot['paths']),
+                     len(snapshot['imports'])))
+
+def build_module_index(home_dir):
+    """
+    Writes ``lib/pythonX.Y/module-index.dat``, which maps every
+    top-level module on the environment's ``sys.path`` to the entries
+    that provide it.  The environment's ``site.py`` uses it to skip
+    searching the other entries on import, in whatever order
+    ``sys.path`` has them then; entries that have changed since the
+    index was built are searched normally.
+    """
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    py_executable = join(bin_dir, expected_exe)
+    if sys.platform == 'win32' or sys.platform == 'cygwin':
+        py_executable += '.exe'
+    logger.notify('Indexing modules on the path of %s', py_executable)
+    call_subprocess([py_executable, '-c', 'import site; site.build_module_index()'],
+                    show_stdout=False)
+
+def compile_environment(home_dir, jobs=None):
+    """
+    Compiles every Python source file of the environment that does not
+    have up-to-date bytecode next to it: the ``site.py`` and
+    ``distutils/__init__.py`` that virtualenv writes, the bootstrap
+    modules copied into ``lib/pythonX.Y``, everything in
+    ``site-packages`` and ``activate_this.py``.  Modules symlinked
+    from the system installation are left to it.  This matters for
+    environments that are read-only at runtime, where the interpreter
+    would otherwise compile these files anew in every process.
+
+    The files are compiled by a pool of ``jobs`` processes (by default
+    one per CPU).
+    """
+    import time
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    filenames = [join(bin_dir, 'activate_this.py')]
+    for dirpath, dirnames, names in os.walk(lib_dir):
+        for name in names:
+            if name.endswith('.py'):
+                filenames.append(join(dirpath, name))
+    prefixes = [ os.path.realpath(p) + os.sep
+                 for p in (getattr(sys, 'real_prefix', sys.prefix),
+                           sys.exec_prefix) ]
+    def system_link(fn):
+        if not os.path.islink(fn):
+            return False
+        real = os.path.realpath(fn)
+        for prefix in prefixes:
+            if real.startswith(prefix):
+                return True
+        return False
+    filenames = [ fn for fn in filenames
+                  if os.path.exists(fn) and not system_link(fn)
+                  and not bytecode_up_to_date(fn) ]
+    logger.start_progress('Compiling %s files...' % len(filenames))
+    start = time.time()
+    try:
+        results = None
+        if len(filenames) > 1 and jobs != 1:
+            try:
+                import multiprocessing
+            except ImportError:
+                pass
+            else:
+                pool = multiprocessing.Pool(jobs)
+                try:
+                    results = pool.map(compile_file, filenames)
+                finally:
+                    pool.close()
+                    pool.join()
+        if results is None:
+            results = map(compile_file, filenames)
+    finally:
+        logger.end_progress()
+    failed = 0
+    for filename, error in results:
+        if error:
+            logger.info('Could not compile %s: %s' % (filename, error))
+            failed += 1
+    logger.notify('Compiled %s files in %.2f seconds (%s failed)'
+                  % (len(filenames) - failed, time.time() - start, failed))
+
+def bytecode_up_to_date(filename):
+    """Tells whether the .pyc/.pyo of ``filename`` matches it"""
+    import imp, struct
+    cfilename = filename + (__debug__ and 'c' or 'o')
+    try:
+        f = open(cfilename, 'rb')
+        try:
+            header = f.read(8)
+        finally:
+            f.close()
+        mtime = long(os.stat(filename).st_mtime)
+    except (IOError, OSError):
+        return False
+    return (header[:4] == imp.get_magic()
+            and header[4:] == struct.pack('<l', mtime & 0xFFFFFFFFL))
+
+def compile_file(filename):
+    """Compiles one file, returning ``(filename, error_or_None)``"""
+    import py_compile
+    cfile = filename + (__debug__ and 'c' or 'o')
+    try:
+        if os.path.islink(cfile) or os.stat(cfile).st_nlink > 1:
+            # Symlinked to the system installation, or hard linked to
+            # a template environment or to the egg cache, which
+            # py_compile would write into
+            os.unlink(cfile)
+    except OSError:
+        pass
+    try:
+        py_compile.compile(filename, doraise=True)
+    except Exception, e:
+        return filename, str(e).strip()
+    return filename, None
 
 def fix_lib64(lib_dir):
     """
@@ -774,8 +2279,12 @@ def fix_lib64(lib_dir):
     instead of lib/pythonX.Y.  If this is such a platform we'll just create a
     symlink so lib64 points to lib
     """
-    if [p for p in distutils.sysconfig.get_config_vars().values() 
-        if isinstance(p, basestring) and 'lib64' in p]:
+    facts = interpreter_facts()
+    if 'lib64' not in facts:
+        facts['lib64'] = bool(
+            [p for p in distutils.sysconfig.get_config_vars().values()
+             if isinstance(p, basestring) and 'lib64' in p])
+    if facts['lib64']:
         logger.debug('This system uses lib64; symlinking lib64 to lib')
         assert os.path.basename(lib_dir) == 'python%s' % sys.version[:3], (
             "Unexpected python lib dir: %r" % lib_dir)
@@ -789,96 +2298,525 @@ def resolve_interpreter(exe):
     If the executable given isn't an absolute path, search $PATH for the interpreter
     """
     if os.path.abspath(exe) != exe:
-        paths = os.environ.get('PATH', '').split(os.pathsep)
-        for path in paths:
-            if os.path.exists(os.path.join(path, exe)):
-                exe = os.path.join(path, exe)
-                break
+        resolved = load_probe_cache()['resolved']
+        key = (exe, os.environ.get('PATH', ''))
+        if key in resolved and os.path.exists(resolved[key]):
+            exe = resolved[key]
+        else:
+            paths = os.environ.get('PATH', '').split(os.pathsep)
+            for path in paths:
+                if os.path.exists(os.path.join(path, exe)):
+                    resolved[key] = exe = os.path.join(path, exe)
+                    save_probe_cache()
+                    break
     if not os.path.exists(exe):
         logger.fatal('The executable %s (from --python=%s) does not exist' % (exe, exe))
         sys.exit(3)
     return exe
 
+############################################################
+## Interpreter probe cache:
+
+# Where virtualenv keeps what it learnt on earlier runs; set to None
+# (--no-cache) to neither use nor update it
+CACHE_DIR = os.environ.get('VIRTUALENV_CACHE_DIR',
+                           os.path.expanduser('~/.virtualenv'))
+
+PROBE_CACHE_VERSION = 1
+
+_probe_cache = None
+
+def load_probe_cache():
+    """
+    Returns the contents of ``probe-cache.dat`` in ``CACHE_DIR``: a
+    dictionary with the facts learnt about each interpreter under
+    ``'interpreters'`` and the executables found on ``$PATH`` under
+    ``'resolved'``.  The file is only read once per process.
+    """
+    global _probe_cache
+    if _probe_cache is None:
+        import marshal
+        _probe_cache = {}
+        if CACHE_DIR:
+            try:
+                f = open(join(CACHE_DIR, 'probe-cache.dat'), 'rb')
+                try:
+                    _probe_cache = marshal.load(f)
+                finally:
+                    f.close()
+            except (IOError, EOFError, ValueError, TypeError):
+                pass
+        if (not isinstance(_probe_cache, dict)
+            or _probe_cache.get('version') != PROBE_CACHE_VERSION):
+            _probe_cache = {}
+        _probe_cache['version'] = PROBE_CACHE_VERSION
+        _probe_cache.setdefault('interpreters', {})
+        _probe_cache.setdefault('resolved', {})
+    return _probe_cache
+
+def save_probe_cache():
+    """Writes the probe cache back, if it was loaded"""
+    import marshal
+    if not CACHE_DIR or _probe_cache is None:
+        return
+    filename = join(CACHE_DIR, 'probe-cache.dat')
+    tmp_filename = '%s.%s' % (filename, os.getpid())
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        f = open(tmp_filename, 'wb')
+        try:
+            marshal.dump(_probe_cache, f)
+        finally:
+            f.close()
+        # Atomic, so that concurrent runs never see half a file
+        os.rename(tmp_filename, filename)
+    except (IOError, OSError), e:
+        logger.info('Cannot write %s: %s' % (filename, e))
+
+def interpreter_facts():
+    """
+    Returns the cached facts about the running interpreter, as a
+    dictionary to add newly probed facts to (see
+    ``save_probe_cache()``).  The facts are dropped when the
+    executable, its version or its prefixes change.
+    """
+    executable = os.path.realpath(sys.executable)
+    try:
+        st = os.stat(executable)
+        key = (executable, st.st_ino, st.st_size, st.st_mtime,
+               sys.version, sys.prefix, sys.exec_prefix)
+    except OSError:
+        # Nothing to key the facts on; do not keep them
+        return {}
+    interpreters = load_probe_cache()['interpreters']
+    facts = interpreters.get(executable)
+    if facts is None or facts.get('key') != key:
+        facts = interpreters[executable] = {'key': key}
+    return facts
+
+def bootstrap_modules(stdlib_dirs):
+    """
+    Returns the names of the entries of ``stdlib_dirs`` that an
+    environment needs until its ``site.py`` has put the real standard
+    library on ``sys.path``: the modules this interpreter imports when
+    started without ``site`` (and with ``-E``) to run the imports of
+    that ``site.py``, as its ``-v`` output shows, and
+    ``UNTRACED_MODULES``.  The names are remembered with the other
+    facts about the interpreter.  If the interpreter cannot be traced,
+    ``REQUIRED_MODULES`` are returned.
+    """
+    import re, tempfile, zlib
+    if is_jython:
+        return REQUIRED_MODULES
+    key = (zlib.crc32(EMBEDDED_FILES['site.py']), stdlib_dirs)
+    facts = interpreter_facts()
+    traced = facts.get('bootstrap_modules')
+    if traced is not None and traced[0] == key:
+        return traced[1]
+    imports = re.findall(r'^import (.*)$', support_file('site.py'), re.M)
+    cmd = [sys.executable, '-S', '-E', '-v', '-c',
+           '; '.join([ 'import %s' % names for names in imports ])]
+    logger.info('Tracing the bootstrap modules with %s' % ' '.join(cmd[:-1]))
+    # Away from anything the current directory would add to sys.path
+    cwd = tempfile.mkdtemp(prefix='virtualenv-trace-')
+    try:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        output = proc.communicate()[0]
+    finally:
+        os.rmdir(cwd)
+    if proc.returncode:
+        logger.warn('Could not trace the modules %s imports (exit code %s); '
+                    'using the usual ones' % (sys.executable, proc.returncode))
+        return REQUIRED_MODULES
+    # Lines like "import os # precompiled from /usr/lib/python2.6/os.pyc"
+    # or 'dlopen("/usr/lib/python2.6/lib-dynload/time.so", 2);'
+    path_regex = re.compile(
+        r'^(?:import \S+ # (?:precompiled from|from|directory|dynamically loaded from) |dlopen\(")([^"\r\n]+)',
+        re.M)
+    names = {}
+    for name in UNTRACED_MODULES:
+        names[name] = None
+    for path in path_regex.findall(output):
+        for stdlib_dir in stdlib_dirs:
+            if path.startswith(stdlib_dir + os.sep):
+                entry = path[len(stdlib_dir) + 1:].split(os.sep)[0]
+                names[os.path.splitext(entry)[0]] = None
+    names = names.keys()
+    names.sort()
+    logger.info('Bootstrap modules: %s' % ', '.join(names))
+    facts['bootstrap_modules'] = (key, names)
+    return names
+
+def list_stdlib_dir(stdlib_dir):
+    """Lists ``stdlib_dir``, remembering the listing until the
+    directory changes"""
+    try:
+        mtime = os.stat(stdlib_dir).st_mtime
+    except OSError:
+        return os.listdir(stdlib_dir)
+    listings = interpreter_facts().setdefault('stdlib_dirs', {})
+    listing = listings.get(stdlib_dir)
+    if listing is None or listing[0] != mtime:
+        listing = listings[stdlib_dir] = (mtime, os.listdir(stdlib_dir))
+    return listing[1]
+
+############################################################
+## Manifest of a created environment:
+
+MANIFEST_VERSION = 2
+
+# What create_environment() does, in order; the manifest records the
+# paths each of these wrote
+MANIFEST_STEPS = ['python', 'distutils', 'setuptools', 'activate']
+
+# While create_environment() runs one of MANIFEST_STEPS, the paths it
+# writes, each mapped to whether its content is digested (see
+# record_written()); None otherwise
+written_paths = None
+
+def record_written(filename, digest=False):
+    """
+    Notes that the step under way wrote ``filename``.  Only the files
+    whose content virtualenv generates (``digest``) are compared by
+    content later; copies and links only by their size and mtime, or
+    their target.
+    """
+    if written_paths is not None:
+        written_paths[os.path.abspath(filename)] = digest
+
+def manifest_key(*options):
+    """
+    Describes how an environment is made: by this interpreter, with
+    these ``options`` and this version of the files virtualenv writes.
+    An environment made differently is not compared to its manifest.
+    """
+    import zlib
+    executable = os.path.realpath(sys.executable)
+    try:
+        st = os.stat(executable)
+        stamp = (st.st_ino, st.st_size, st.st_mtime)
+    except OSError:
+        stamp = None
+    crc = 0
+    names = EMBEDDED_FILES.keys()
+    names.sort()
+    for name in names:
+        crc = zlib.crc32(EMBEDDED_FILES[name], crc)
+    return (executable, stamp, sys.version, crc) + tuple(
+        [ isinstance(o, list) and tuple(o) or o for o in options ])
+
+def manifest_entry(filename, digest=False):
+    """
+    Returns what the manifest records about ``filename``: its link
+    target, ``None`` for a directory, or the size, mtime and (if
+    ``digest``, else None) MD5 digest of a file.
+    """
+    if os.path.islink(filename):
+        return os.readlink(filename)
+    elif os.path.isdir(filename):
+        return None
+    st = os.stat(filename)
+    if not digest:
+        return (st.st_size, st.st_mtime, None)
+    try:
+        from hashlib import md5
+    except ImportError:
+        from md5 import md5
+    f = open(filename, 'rb')
+    try:
+        digest = md5(f.read()).hexdigest()
+    finally:
+        f.close()
+    return (st.st_size, st.st_mtime, digest)
+
+def save_manifest(home_dir, key, py_executable, written, previous=None):
+    """
+    Records in ``lib/pythonX.Y/install-manifest.dat`` the paths that
+    each of ``MANIFEST_STEPS`` wrote into ``home_dir``, relative to
+    it.  ``written`` maps a step to what ``record_written()`` collected
+    while it ran; the steps that were not run keep their paths from the
+    ``previous`` manifest.
+    """
+    import marshal
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    home_dir = os.path.abspath(home_dir)
+    entries = {}
+    for step in MANIFEST_STEPS:
+        if step not in written:
+            entries[step] = previous['entries'][step]
+            continue
+        entries[step] = step_entries = {}
+        for filename, digest in written[step].items():
+            if (not filename.startswith(home_dir + os.sep)
+                or not os.path.lexists(filename)):
+                continue
+            step_entries[filename[len(home_dir)+len(os.sep):]] = \
+                manifest_entry(filename, digest)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'key': key,
+        'py_executable': os.path.abspath(py_executable)[len(home_dir)+len(os.sep):],
+        'entries': entries,
+        }
+    filename = join(lib_dir, 'install-manifest.dat')
+    logger.info('Writing %s' % filename)
+    f = open(filename, 'wb')
+    try:
+        marshal.dump(manifest, f)
+    finally:
+        f.close()
+
+def load_manifest(home_dir):
+    """Returns the manifest of ``home_dir``, or None"""
+    import marshal
+    filename = join(path_locations(home_dir)[1], 'install-manifest.dat')
+    try:
+        f = open(filename, 'rb')
+        try:
+            manifest = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def manifest_drift(home_dir, manifest):
+    """
+    Returns those of ``MANIFEST_STEPS`` that wrote a path which has
+    since disappeared or changed; nothing else in ``home_dir`` is
+    looked at.  A file whose size and mtime are as recorded is taken
+    to be unchanged; others are compared by content where the manifest
+    has their digest.
+    """
+    redo = []
+    for step in MANIFEST_STEPS:
+        for relpath, recorded in manifest['entries'][step].items():
+            filename = join(home_dir, relpath)
+            if not manifest_entry_changed(filename, recorded):
+                continue
+            logger.info('%s has changed' % filename)
+            redo.append(step)
+            break
+    return redo
+
+def manifest_entry_changed(filename, recorded):
+    try:
+        if isinstance(recorded, tuple):
+            if os.path.islink(filename):
+                return True
+            st = os.stat(filename)
+            if (st.st_size, st.st_mtime) == recorded[:2]:
+                return False
+            return (recorded[2] is None
+                    or manifest_entry(filename, True)[2] != recorded[2])
+        elif recorded is None:
+            return not os.path.isdir(filename) or os.path.islink(filename)
+        else:
+            return (not os.path.islink(filename)
+                    or os.readlink(filename) != recorded)
+    except (IOError, OSError):
+        return True
+
 ############################################################
 ## Relocating the environment:
 
-def make_environment_relocatable(home_dir):
+def make_environment_relocatable(home_dir, dry_run=False, jobs=None):
     """
     Makes the already-existing environment use relative paths, and takes out 
     the #!-based environment selection in scripts.
+
+    The scripts in the environment's bin directory and the .pth and
+    .egg-link files of its own ``lib/pythonX.Y`` and ``site-packages``
+    are listed in one pass, then up to ``jobs`` (default
+    ``FILE_JOBS``) of them are fixed up at once.  Only the first line
+    of a script is read to decide whether it needs changing.  With
+    ``dry_run``, reports what would be changed without writing
+    anything.
     """
     activate_this = os.path.join(home_dir, 'bin', 'activate_this.py')
     if not os.path.exists(activate_this):
         logger.fatal(
             'The environment doesn\'t have a file %s -- please re-run virtualenv '
             'on this environment to update it' % activate_this)
-    fixup_scripts(home_dir)
-    fixup_pth_and_egg_link(home_dir)
+    timings.reset()
+    files = find_relocatable_files(home_dir)
+    timings.phase('find_relocatable_files')
+    def fixup(kind, filename):
+        messages = []
+        def log(level, msg):
+            messages.append((level, msg))
+        try:
+            if kind == 'script':
+                changed = fixup_script(filename, home_dir, dry_run, log)
+            elif kind == 'pth':
+                changed = fixup_pth_file(filename, dry_run, log)
+            else:
+                changed = fixup_egg_link(filename, dry_run, log)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            return False, messages, sys.exc_info()
+        return changed, messages, None
+    outcomes = run_parallel(fixup, files, jobs or FILE_JOBS)
+    changed = {'script': 0, 'pth': 0, 'egg-link': 0}
+    first_error = None
+    for (kind, filename), (result, exc_info) in zip(files, outcomes):
+        if exc_info is None:
+            file_changed, messages, exc_info = result
+            for level, msg in messages:
+                logger.log(level, msg)
+            if file_changed:
+                changed[kind] += 1
+        if exc_info is not None and first_error is None:
+            first_error = exc_info
+    timings.phase('fixup_files')
+    if first_error is not None:
+        raise first_error[0], first_error[1], first_error[2]
+    if dry_run:
+        verb = 'Would make'
+    else:
+        verb = 'Made'
+    logger.notify('%s %s scripts, %s .pth files and %s .egg-link files '
+                  'relative (of %s files)'
+                  % (verb, changed['script'], changed['pth'],
+                     changed['egg-link'], len(files)))
     ## FIXME: need to fix up distutils.cfg
 
 OK_ABS_SCRIPTS = ['python', 'python%s' % sys.version[:3],
-                  'activate', 'activate.bat', 'activate_this.py']
+                  'activate', 'activate.bat', 'activate_this.py',
+                  'activate_this.pyc']
+
+# How much of a file in bin/ fixup_script() reads to find its first
+# line; binaries like bin/python need not be read at all
+SCRIPT_HEADER_SIZE = 4096
 
-def fixup_scripts(home_dir):
+def find_relocatable_files(home_dir):
+    """
+    Lists what --relocatable fixes up in the environment, as ``(kind,
+    filename)`` with ``kind`` one of 'script', 'pth' or 'egg-link':
+    everything in its bin directory, and the .pth and .egg-link files
+    of its ``lib/pythonX.Y`` and ``site-packages``.
+    """
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    files = []
+    for name in os.listdir(bin_dir):
+        files.append(('script', join(bin_dir, name)))
+    for dir in lib_dir, join(lib_dir, 'site-packages'):
+        if not os.path.isdir(dir):
+            continue
+        for name in os.listdir(dir):
+            if name.endswith('.pth'):
+                files.append(('pth', join(dir, name)))
+            elif name.endswith('.egg-link'):
+                files.append(('egg-link', join(dir, name)))
+    return files
+
+def fixup_scripts(home_dir, dry_run=False):
+    bin_dir = os.path.join(home_dir, 'bin')
+    for filename in os.listdir(bin_dir):
+        fixup_script(os.path.join(bin_dir, filename), home_dir, dry_run)
+
+def fixup_script(filename, home_dir, dry_run=False, log=None):
+    """
+    Replaces the #! line of the script ``filename`` of the environment
+    ``home_dir`` with one that finds Python on the $PATH, and makes it
+    activate the environment.  Returns whether the script was (or,
+    with ``dry_run``, would be) changed.
+    """
+    if log is None:
+        log = logger.log
     # This is what we expect at the top of scripts:
     shebang = '#!%s/bin/python' % os.path.normcase(os.path.abspath(home_dir))
     # This is what we'll put:
     new_shebang = '#!/usr/bin/env python%s' % sys.version[:3]
-    activate = "import os; activate_this=os.path.join(os.path.dirname(__file__), 'activate_this.py'); execfile(activate_this, dict(__file__=activate_this)); del os, activate_this"
-    bin_dir = os.path.join(home_dir, 'bin')
-    for filename in os.listdir(bin_dir):
-        filename = os.path.join(bin_dir, filename)
-        f = open(filename, 'rb')
-        lines = f.readlines()
-        f.close()
-        if not lines:
-            logger.warn('Script %s is an empty file' % filename)
-            continue
-        if not lines[0].strip().startswith(shebang):
+    # imp.load_source() runs activate_this.py from its cached
+    # activate_this.pyc when that is up to date, unlike execfile():
+    activate = "import os, imp; activate_this=os.path.join(os.path.dirname(__file__), 'activate_this.py'); imp.load_source('_activate_this', activate_this); del os, imp, activate_this"
+    if os.path.isdir(filename):
+        return False
+    f = open(filename, 'rb')
+    try:
+        first_line = f.readline(SCRIPT_HEADER_SIZE)
+        if not first_line:
+            log(Logger.WARN, 'Script %s is an empty file' % filename)
+            return False
+        if not first_line.strip().startswith(shebang):
             if os.path.basename(filename) in OK_ABS_SCRIPTS:
-                logger.debug('Cannot make script %s relative' % filename)
-            elif lines[0].strip() == new_shebang:
-                logger.info('Script %s has already been made relative' % filename)
+                log(Logger.DEBUG, 'Cannot make script %s relative' % filename)
+            elif first_line.strip() == new_shebang:
+                log(Logger.INFO, 'Script %s has already been made relative' % filename)
             else:
-                logger.warn('Script %s cannot be made relative (it\'s not a normal script that starts with %s)'
-                            % (filename, shebang))
-            continue
-        logger.notify('Making script %s relative' % filename)
-        lines = [new_shebang+'\n', activate+'\n'] + lines[1:]
-        f = open(filename, 'wb')
-        f.writelines(lines)
+                log(Logger.WARN, 'Script %s cannot be made relative (it\'s not a normal script that starts with %s)'
+                    % (filename, shebang))
+            return False
+        # Skip the rest of an overly long #! line
+        while not first_line.endswith('\n'):
+            first_line = f.readline(SCRIPT_HEADER_SIZE)
+            if not first_line:
+                break
+        if dry_run:
+            log(Logger.NOTIFY, 'Would make script %s relative' % filename)
+        else:
+            log(Logger.NOTIFY, 'Making script %s relative' % filename)
+            rewrite_file(filename, new_shebang+'\n'+activate+'\n', f)
+    finally:
         f.close()
+    return True
 
-def fixup_pth_and_egg_link(home_dir):
-    """Makes .pth and .egg-link files use relative paths"""
-    home_dir = os.path.normcase(os.path.abspath(home_dir))
-    for path in sys.path:
-        if not path:
-            path = '.'
-        if not os.path.isdir(path):
-            continue
-        path = os.path.normcase(os.path.abspath(path))
-        if not path.startswith(home_dir):
-            logger.debug('Skipping system (non-environment) directory %s' % path)
-            continue
-        for filename in os.listdir(path):
-            filename = os.path.join(path, filename)
-            if filename.endswith('.pth'):
-                if not os.access(filename, os.W_OK):
-                    logger.warn('Cannot write .pth file %s, skipping' % filename)
-                else:
-                    fixup_pth_file(filename)
-            if filename.endswith('.egg-link'):
-                if not os.access(filename, os.W_OK):
-                    logger.warn('Cannot write .egg-link file %s, skipping' % filename)
-                else:
-                    fixup_egg_link(filename)
+def rewrite_file(filename, content, rest=None):
+    """
+    Replaces ``filename`` with ``content``, followed by what is left
+    to read of the open file ``rest``.  The new content goes to a
+    temporary file next to it, which is then renamed over it, so an
+    interrupted rewrite leaves the file as it was.
+    """
+    import tempfile
+    filename = os.path.realpath(filename)
+    fd, tmp_filename = tempfile.mkstemp(
+        prefix='.%s.' % os.path.basename(filename),
+        dir=os.path.dirname(filename))
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(content)
+            if rest is not None:
+                shutil.copyfileobj(rest, f)
+        finally:
+            f.close()
+        if hasattr(os, 'chmod'):
+            os.chmod(tmp_filename, os.stat(filename).st_mode & 07777)
+        if sys.platform == 'win32':
+            # os.rename() does not replace existing files on Windows
+            os.remove(filename)
+        os.rename(tmp_filename, filename)
+    except:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    timings.count('write')
 
-def fixup_pth_file(filename):
+def fixup_pth_and_egg_link(home_dir, dry_run=False):
+    """Makes .pth and .egg-link files use relative paths"""
+    for kind, filename in find_relocatable_files(home_dir):
+        if kind == 'pth':
+            fixup_pth_file(filename, dry_run)
+        elif kind == 'egg-link':
+            fixup_egg_link(filename, dry_run)
+
+def fixup_pth_file(filename, dry_run=False, log=None):
+    if log is None:
+        log = logger.log
+    if not os.access(filename, os.W_OK):
+        log(Logger.WARN, 'Cannot write .pth file %s, skipping' % filename)
+        return False
     lines = []
     prev_lines = []
     f = open(filename)
-    prev_lines = f.readlines()
+    prev_lines = [ line.rstrip('\r\n') for line in f.readlines() ]
     f.close()
     for line in prev_lines:
         line = line.strip()
@@ -888,28 +2826,37 @@ def fixup_pth_file(filename):
         else:
             new_value = make_relative_path(filename, line)
             if line != new_value:
-                logger.debug('Rewriting path %s as %s (in %s)' % (line, new_value, filename))
+                log(Logger.DEBUG, 'Rewriting path %s as %s (in %s)' % (line, new_value, filename))
             lines.append(new_value)
     if lines == prev_lines:
-        logger.info('No changes to .pth file %s' % filename)
-        return
-    logger.notify('Making paths in .pth file %s relative' % filename)
-    f = open(filename, 'w')
-    f.write('\n'.join(lines) + '\n')
-    f.close()
-
-def fixup_egg_link(filename):
+        log(Logger.INFO, 'No changes to .pth file %s' % filename)
+        return False
+    if dry_run:
+        log(Logger.NOTIFY, 'Would make paths in .pth file %s relative' % filename)
+    else:
+        log(Logger.NOTIFY, 'Making paths in .pth file %s relative' % filename)
+        rewrite_file(filename, '\n'.join(lines) + '\n')
+    return True
+
+def fixup_egg_link(filename, dry_run=False, log=None):
+    if log is None:
+        log = logger.log
+    if not os.access(filename, os.W_OK):
+        log(Logger.WARN, 'Cannot write .egg-link file %s, skipping' % filename)
+        return False
     f = open(filename)
     link = f.read().strip()
     f.close()
     if os.path.abspath(link) != link:
-        logger.debug('Link in %s already relative' % filename)
-        return
+        log(Logger.DEBUG, 'Link in %s already relative' % filename)
+        return False
     new_link = make_relative_path(filename, link)
-    logger.notify('Rewriting link %s in %s as %s' % (link, filename, new_link))
-    f = open(filename, 'w')
-    f.write(new_link)
-    f.close()
+    if dry_run:
+        log(Logger.NOTIFY, 'Would rewrite link %s in %s as %s' % (link, filename, new_link))
+    else:
+        log(Logger.NOTIFY, 'Rewriting link %s in %s as %s' % (link, filename, new_link))
+        rewrite_file(filename, new_link)
+    return True
 
 def make_relative_path(source, dest, dest_is_directory=True):
     """
@@ -949,7 +2896,11 @@ def make_relative_path(source, dest, dest_is_directory=True):
 ############################################################
 ## Bootstrap script creation:
 
-def create_bootstrap_script(extra_text, python_version=''):
+# What makes bootstrap scripts, which prune_script() leaves out of them
+SCRIPT_MAKERS = ['create_bootstrap_script', 'prune_script', 'fold_test',
+                 'dotted_name', 'compile_bootstrap_script']
+
+def create_bootstrap_script(extra_text, python_version='', platform=None):
     """
     Creates a bootstrap script, which is like this script but with
     extend_parser, adjust_options, and after_install hooks.
@@ -988,6 +2939,12 @@ def create_bootstrap_script(extra_text, python_version=''):
     script will start with ``#!/usr/bin/env python2.4`` instead of
     ``#!/usr/bin/env python``.  You can use this when the script must
     be run with a particular Python version.
+
+    If you provide ``platform`` (a value of ``sys.platform``, like
+    ``'linux2'`` or ``'win32'``) the script is slimmed down to what
+    runs there, with ``python_version`` (if given): see
+    ``prune_script()``.  ``compile_bootstrap_script()`` can then turn
+    it into bytecode.
     """
     filename = __file__
     if filename.endswith('.pyc'):
@@ -995,55 +2952,393 @@ def create_bootstrap_script(extra_text, python_version=''):
     f = open(filename, 'rb')
     content = f.read()
     f.close()
+    if platform is not None:
+        content = prune_script(content, platform, python_version)
     py_exe = 'python%s' % python_version
     content = (('#!/usr/bin/env %s\n' % py_exe)
                + '## WARNING: This file is generated\n'
                + content)
     return content.replace('##EXT' 'END##', extra_text)
 
+def prune_script(content, platform, python_version=''):
+    """
+    Leaves out of the source of this script, ``content``, the branches
+    that cannot run on ``platform`` (a value of ``sys.platform``) with
+    Python ``python_version`` (like ``'2.6'``; if empty, the version
+    tests are all kept): those of ``if`` statements testing
+    ``sys.platform``, ``is_jython``, ``sys.version_info[:2]`` or for a
+    Mac OS X framework build, and the embedded files that only those
+    used.  The functions in ``SCRIPT_MAKERS`` go too.  Whole lines are
+    dropped, so everything else is left as it was.  This needs Python
+    2.6 or later.
+    """
+    import ast, re, tokenize
+    from cStringIO import StringIO
+    version = None
+    match = re.match(r'(\d+)\.(\d+)$', python_version)
+    if match:
+        version = (int(match.group(1)), int(match.group(2)))
+    lines = content.splitlines(True)
+    # The last line of the logical line each line is in:
+    logical_end = {}
+    start = 1
+    for token in tokenize.generate_tokens(StringIO(content).readline):
+        if token[0] == tokenize.NEWLINE:
+            for lineno in range(start, token[2][0] + 1):
+                logical_end[lineno] = token[2][0]
+            start = token[2][0] + 1
+    deleted = {}
+    replaced = {}
+
+    def end_of(node):
+        last = max([ n.lineno for n in ast.walk(node) if hasattr(n, 'lineno') ])
+        return logical_end.get(last, last)
+
+    def delete(first, last):
+        for lineno in range(first, last + 1):
+            deleted[lineno] = None
+            replaced.pop(lineno, None)
+
+    def indent_of(lineno):
+        line = lines[lineno - 1]
+        return line[:len(line) - len(line.lstrip())]
+
+    def prune_block(stmts):
+        left = 0
+        for node in stmts:
+            if isinstance(node, ast.If):
+                if not prune_if(node, False):
+                    left += 1
+                continue
+            left += 1
+            for field in 'body', 'orelse', 'finalbody':
+                if getattr(node, field, None):
+                    prune_block(getattr(node, field))
+            for handler in getattr(node, 'handlers', []):
+                prune_block(handler.body)
+        if not left:
+            replaced[stmts[0].lineno] = indent_of(stmts[0].lineno) + 'pass\n'
+
+    def prune_if(node, is_elif):
+        """Prunes the ``if`` (or ``elif``) ``node``, returning whether
+        it is gone altogether"""
+        value = fold_test(node.test, platform, version)
+        body_end = end_of(node.body[-1])
+        end = end_of(node)
+        else_line = None
+        chained = False
+        if node.body[0].lineno == node.lineno:
+            value = None
+        if node.orelse:
+            first = node.orelse[0]
+            if lines[first.lineno - 1].lstrip().startswith('elif'):
+                else_line = first.lineno
+                chained = True
+            else:
+                for lineno in range(body_end + 1, first.lineno):
+                    if lines[lineno - 1].strip() == 'else:':
+                        else_line = lineno
+                if else_line is None:
+                    # else: on one line with its body
+                    value = None
+        if value is True:
+            prune_block(node.body)
+            if node.orelse:
+                delete(else_line, end)
+        elif value is False and not node.orelse:
+            delete(node.lineno, end)
+            return not is_elif
+        elif value is False and (is_elif or chained):
+            delete(node.lineno, else_line - 1)
+            if chained and not is_elif:
+                line = lines[else_line - 1]
+                replaced[else_line] = line.replace('elif', 'if', 1)
+                return prune_if(node.orelse[0], False)
+            elif chained:
+                prune_if(node.orelse[0], True)
+            else:
+                prune_block(node.orelse)
+        elif value is False:
+            # Only the else: branch runs, but it is kept where it is
+            # rather than re-indented
+            delete(node.body[0].lineno, body_end)
+            replaced[node.body[0].lineno] = (
+                indent_of(node.body[0].lineno) + 'pass\n')
+            prune_block(node.orelse)
+        else:
+            prune_block(node.body)
+            if chained:
+                prune_if(node.orelse[0], True)
+            elif node.orelse:
+                prune_block(node.orelse)
+        return False
+
+    tree = ast.parse(content)
+    prune_block(tree.body)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in SCRIPT_MAKERS:
+            delete(node.lineno, end_of(node))
+    new_lines = []
+    for lineno in range(1, len(lines) + 1):
+        if lineno in replaced:
+            new_lines.append(replaced[lineno])
+        elif lineno not in deleted:
+            new_lines.append(lines[lineno - 1])
+    content = ''.join(new_lines)
+    # Drop the embedded files nothing refers to any more
+    file_regex = re.compile(
+        r'##file ([^\n]*)\n(EMBEDDED_FILES\[[^\n]*\])\s*=\s*"""\n(.*?)"""\n',
+        re.S)
+    code = file_regex.sub('', content)
+    def drop_unused(match):
+        if (("support_file(%r)" % match.group(1)) in code
+            or ("EMBEDDED_FILES[%r]" % match.group(1)) in code):
+            return match.group(0)
+        return ''
+    return file_regex.sub(drop_unused, content)
+
+def fold_test(node, platform, version):
+    """
+    Returns the value the test ``node`` (an ``ast`` expression) has on
+    ``platform`` with Python ``version`` (a tuple like ``(2, 6)``, or
+    None if unknown), or None if it is not known before run time
+    """
+    import ast, operator
+    if isinstance(node, ast.BoolOp):
+        values = [ fold_test(value, platform, version)
+                   for value in node.values ]
+        if isinstance(node.op, ast.And):
+            if False in values:
+                return False
+            if None not in values:
+                return True
+        else:
+            if True in values:
+                return True
+            if None not in values:
+                return False
+        return None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        value = fold_test(node.operand, platform, version)
+        if value is None:
+            return None
+        return not value
+    if isinstance(node, ast.Name) and node.id == 'is_jython':
+        return platform.startswith('java')
+    if (isinstance(node, ast.Call)
+        and dotted_name(node.func) == 'sys.platform.startswith'
+        and len(node.args) == 1 and isinstance(node.args[0], ast.Str)):
+        return platform.startswith(node.args[0].s)
+    if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+        return None
+    left, op, right = node.left, node.ops[0], node.comparators[0]
+    if dotted_name(left) == 'sys.platform' and isinstance(right, ast.Str):
+        value, other = platform, right.s
+    elif (isinstance(left, ast.Str) and left.s == 'Python.framework'
+          and isinstance(op, ast.In)):
+        if platform == 'darwin':
+            return None
+        return False
+    elif (version is not None and isinstance(left, ast.Subscript)
+          and dotted_name(left.value) == 'sys.version_info'
+          and isinstance(left.slice, ast.Slice)
+          and left.slice.lower is None and left.slice.step is None
+          and isinstance(left.slice.upper, ast.Num)
+          and left.slice.upper.n == 2
+          and isinstance(right, ast.Tuple)):
+        value = version
+        other = tuple([ isinstance(elt, ast.Num) and elt.n
+                        for elt in right.elts ])
+    else:
+        return None
+    operators = {ast.Eq: operator.eq, ast.NotEq: operator.ne,
+                 ast.Lt: operator.lt, ast.LtE: operator.le,
+                 ast.Gt: operator.gt, ast.GtE: operator.ge}
+    if op.__class__ not in operators:
+        return None
+    return bool(operators[op.__class__](value, other))
+
+def dotted_name(node):
+    """Returns ``'sys.platform'`` for the ``ast`` of ``sys.platform``
+    (and so on), or None for other expressions"""
+    import ast
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value = dotted_name(node.value)
+        if value is not None:
+            return value + '.' + node.attr
+    return None
+
+def compile_bootstrap_script(script, filename):
+    """
+    Writes the bootstrap ``script`` (from ``create_bootstrap_script()``)
+    to ``filename`` as bytecode, which ``python filename`` runs without
+    having to parse it.  Only this version of Python can run it.
+    """
+    import imp, marshal
+    code = compile(script, os.path.basename(filename), 'exec')
+    f = open(filename, 'wb')
+    f.write(imp.get_magic())
+    # No modification time: there is no source to compare it with
+    f.write('\0\0\0\0')
+    marshal.dump(code, f)
+    f.close()
+
 ##EXTEND##
 
 ##file site.py
-SITE_PY = """
-eJylWE2P2zYQvftXsM7BMmK7zTVFDukhSC9J0KZIgyAwaImymaVIgaTs9b/vG35IlOPdS/fgxDI5
-nI83bx71gn0+CXaW1g9cCX1mSye92PXX5WIhu95Yz4zbMHd1i8UL9kWo2nSCeVNs+YV+KawwPJPW
-6E5oz5Q5yppJx6Q+C+dFg/8wj8WtUcpcpD6ydtC1l0ZvYMZy/GaxgGv2Y3Ce2UFrWpR2HZU54ARX
-m14w0+IZTHemGZTYsIOo+eAEzHSD8rJXd13Cenk8eaxmzvP6AS4ZGDc92RO8PjFDPpA3XDfschI6
-Pi7DqrlSji3Fo6hbqUS1XpIRCeM9t1iwckUiydA1u37mVvKDEi6GNLrPsI+Zs7AXK70XerdYNKIt
-0ryXWvpq/XrB8Bc+XrB30jq/YRfBGuGF7aQW5DAsBcu9FY68LcqLp8rUHIXYUHjJjjaeNnIfQtDc
-y7Ogmu9goZWP2AV3aKmSh/7qT4j1DXCx61GuXSOt5p2o9ntKxX6/DivTzjeFmfCcUraf/Vg8WSR/
-PojHGJYVvAmFr1EBVKrwKVRfsE/RHalRTKU4ASkZ8RTPhTsGTDQE2RrWfErNHWCkEFsKrRe6yvH9
-MFJXY+AbtjJWHrfRi51/9Kt1jJh8wwlqiq6l70213jlvZV/FZe2uVsYBMjnYtxq1aKWG+9cQ9IH8
-RGicOXnUFKgVSor2F8b+6SmQWFy4hSRhYbJzJyTAMOXnhDwcBKCcG8rEhvIS0HQCXd4mMxGODuF0
-SuqH0LE4k4CxRBZ+jWn4d/d1yVB5UXtjrzvG/hg8YHSB/8lOjRa2gtCcoISYyPngN0Np6PgeDciP
-YrQkcXAsbLIS2ylHMatWWJBz6GdJGc+rjXbS+WyU0UPHWmu6CJ6vn99//PDp7ef3OYepOzesV4Mr
-thwGqXzMRIG6A6oWov8CQqNeTGYcP1P5wFLXEafjUdEinDQJoiLkqkPz08qOHZCUjOF43EEcZSpb
-OwUXqOkSmQPgYY3RIoFYtmw1nbgirgGcU/oihYQmDWGQsT3YIfZ0WvSt3P99V5tB+2r1erVmL9mr
-2MnKiWdM/RY9KZ7HTL4ZA/j2er7pe+wPY5kkhy3XR1HNl6zvHhgMf5PfC1LiB0f/VndWre+wTIQp
-pVobvb2t1QTbVA9E4EWXzBQMRGyFCnE/IxlkNHPLc7FtGD6qnJx1EeqYsBBi8Q380itew1KgnM0t
-B23YqxRtrQTXe/wc0gArCm0xHXYD2jFDaOiA0dgIoRXn9JIa2EUQnrlU1D5sJOF8wiYDlRjxSnmE
-IDAPIvCKuehpXDKaImipz4Z1/CHzgAxSAM5ZIopElCfymEoiSKmgdVXksmJKTDPuZtTkUp65GsRz
-QWJi9TjSbcaxAnjTKWOvxkacAkDlqRXZxdgH9Oz/q32oJpneg0smfIehVCABYymdv1qPe8ECeb14
-JBqsSmvFIfRHU+dhMU6y2YguIDUu+HmQ364a1VF56iYJIVcVY3M08+wZd4TCX2maPYnPqSoXCYqE
-0AE2AZMAHVQx2Rl66lh9hDqSAOXHv7cORZcttKvQtWnopyCYILQwqjEUs2p1obCDS4bC9iVvGjoX
-U42UYXU5SehHADb4ADlCMOBgfHJyHch5sNQFyUjKEKuc1LWgjT13JGKWY+6WhN9Sf66hfzGC6YRk
-JYY49NDBdE5WT2FySHzQyEjDqRy/uRWmtkF7ZZKD7zFgCm9sfnTrny21qB8sEmKG2EtBbxmbDGW1
-fu+W0BiYpdpceCRZylE8eXuRjQjHjYogHrqJnRjoG7LZT9GFnkzt3VvgnmTx1OcTo5xA1weBcEKO
-VezpHPGEnM5ABl1j0qSfJuxNbz2pF7XZxrptyeR2zFrUjj/TPKA+p+uM9neFSLThThI1uwssAVST
-+5eTAQHHcUWzKCc82SjS/hrIq9VA4N5kQXZKI2zi7Rt8TNWkSw11BOFoHANJhwNsg27CTe7uJWw1
-2snUP6ZlLishrAgLRV0iEkcDN71mAT4qN8rfJKHsoK50iNHHkYKmsDMoLHe9P8XBEwdZI3HDBKgo
-DJf5xbSgA4k44p024TkLR2Ed2ICeRgcTTIxqnp66YUXh/5MImiWI7hszQBAiIlNkcV/mJHzJKhZX
-W6YFt0WDT9qSihnuJrl5hG4yQ8RmoCCqdM0OjylxyU7MHpbXaEYOTkM/AzFmKEQCWpFa8yRkoLvk
-FXJ3zejkFjBOl/0xTwnwW2MJUrPLBKhmzp2zVEVRHpmRtz7hMZ7acT2EpgkKim45Wc+N6q+oYdau
-36JI1eJy+4hYMbgF77OLU2+DLvKPt5J0PoZxYwGABzE+xNVv2lvCab5vdHLHe9xem2pCWLRSivVZ
-CPMN00yOiP1Jv78sgn85HUsvgd7zM+Eoj8hwhz3QtWZ8xUOFpFsiaTlQaZgbjuib3owknnoxf1tD
-/fjsi5o4B8I7pXQMOwrv6G2S2GZfOJwOJYob2wTCuepMw49O7K2pBc3c32EnKIZwDzPem64zzj9x
-2w7HSZ+YoPQJZkA7Z3kO47L6EiTBOPcSf3fce4ponPuachMVA/w6oq3ovRTBGd+dwGBvSGaiUuQA
-jknvymqOLSBokqHBBIlYK2NGG+oW6AN6T5Tfxg0Y3WKH8v/0wmnxH43XtjI=
-""".decode("base64").decode("zlib")
+EMBEDDED_FILES['site.py'] = """
+eJzFPWuP20aS3+dXMDICSRuNLr4Pd4CCOcB36yDGZe3AdpLdmwwEjtSa4Q5FEiQ1Y3mx//3q2Q92
+UyNn77DCbiyR3dVd1fXu6p4X2cd7kz0WbX/IS1M9ZpOu6M2yOU4uLop9U7d9VneLrDvCf+D3Itvn
+bXeflxcXL7JfTbmp9ybraw/AV/jGg5nBs6Ktq72p+qys74pNVnRZUT2arjdb+JL10HhXl2X9VFR3
+2e5QbfqirhYAps3hXQsN8ir766Hrs/ZQVdhIet2V9S2M0G3qxmT1Dp4B6H29PZRmkd2aTX7oDIDB
+poBAb/YOO5yE+WQ2B28SDK6LIOXVFqDk1VEHfMzbIr8tTZfB9Ey2L+7uexgvqx9N+9QWfW+q7PaY
+Ff0yy2YfERT8DyDXAObp/uhRa11URT+bZ7dFte1oEvembABnJUOXbc2uqGCSu0NL1NjWTxUiVQM1
+NzCZKt/DRG7NroapFD28h58wWUABKGXKzqyyrkYi9llVe+v7ItsAXbunvMGB91l96LNdW++zQ7WF
+cQ6AXV7unvIjvG7rw939cn5xAbOJp7+6yOBT1vl23VV5093XfXaVrYMH1KTLH03QJHjgoGzqrbEQ
+8Ae9Kqquz8tyzesCY2/NJ2yVek4dPgCqH9t8Q7DsD3r1Y/75+FN//4ZYvMP34RNqlG+3SK1t0a57
+7LnFdu4htQGWXDf9/VqEBRqET7iRwa/01LRt3VKzwbMLavkie7MjPvjlzfuPP7/68fXbX9Yf3nx8
+vf74/tV/vQ6ESblQOCDPdgVwq0B5ArEsQDZNvrlnhgYZ6E2DnAKSBkzdQZuyxH+pzWQJM5kQDGJ4
+BsOvGJNJVgIjirDsSSyyvGkM/IPQW9MdSiBlL7yGkJaMVC9rYJdgVndLQWV5Z/rZNIntdD5Xonxf
+tF2/QKy2pjftHifyRMJHktrA4EQSp8fgKcoHLNTCw6eqe+wI0ytgqlXeF4+kG5YAYVd8gl4y5bK4
+bUCE6gqmDZNtQBMtYcmR1LP1GnFbr+fUUnpeeWDoOWqXdfDSe+Itdo4QHosa5A04xyofVQBZaXao
+XECagdyZFR5oVwibwmrX7QMvSFVXRtcbZ9nxYqBeMLhUwMMA8x7ELtuAWr2D311RiVC8yGb1oc0m
+dVvcXfJEl/2nfrLI6DGy/WWTbx7yO9NNMiCH2fR1exRWAP1Y7wQODu9xFCr8rtganvV8ge8rXE3S
+QA9FA9yTb0FfSffEDIiBTd4CP4KmS+v0nFlRgHQIHAZMzV2VKQmDLLmnlwLNNbO8MHfcvGzu887M
+ptjyUltOLb++NZ+YXREvmuwGJAmJ7XhNVuknZjNRYjmuuSUirNwTCCiYsS3K1Qag9cLyCfO65H7S
++7V70RGdb1EDAAWYBfq6wRmwfkBarGg2KgfV2EqItQPeM+UOYdIsAVJeERidmCoQNwugR9Hfk+CB
+CYshg7F87xl85FFfC/mqDwUF4TR5Cz+nnW/XAbVDWxHx2avwWAJYHt6jBWU1RetTppYAuQYwBC9l
+oWyFHT32RpkjVoQuupaTMj+aFvjLalygd4b0ARFjZ8Byp3IbCFHdivF/uq9Lw7NcWKOdC5hN3aHO
+qsEvAb2X9wqoz4HgDRMtR2m+Axg+WwhXFjs3aIGA+uwtaAs23iQAwJtID09rSfvrqfd8emN7MLpB
+Q34kbcj7iFtfW4lyoJ7u0fJ8bA9eB/zsUAGD5pqpFv5rXVQzBnV9+fJmkU0HjIRmw4cQo7XD39vZ
+fNn1bdHMwua75aasQbTDp8xpa98s2O8ArSnRqvEAi+GIi+xlCAxWYhYBBMYUAgFP4eIowuZTAQs/
+CyDoJyDKEGSSNPNVBOgW5voQPOWJLNm6R3ATahDpeekN5jThqwoMMHiwICVHEkocDXkdWfWOFHRr
+ysLsvsqynxsWS7TogFC/8EQ3oe9A7kVyYRKgikBCNUCo2aPvCzBKnemdYWIfsYMl2oM380DOP4yJ
+ymQCCP4LY/jn5V88+waC+58HdJ6fYP6qSUDYWoPOvvgPgBNOnuaNEk/KlO2NhVQYCS4UClNWsRhV
+5a/6gCh2vA3EB8gbqm7wYcc+PFmWv3z84d3bn159/EFpKB7jImvKQ+d1uT0UZc+U8EwSBCU5Yf8r
++hLggKnGQe8hh9GbozVidiiG6LSXGPk9xEYcZtwCUVSN8nC35q6QZds55J7ERchR2YGK3YKuWlpN
+NnQg3QSmHofzaiK4NTiF7MpJt2u/y81yUx8qALOazrNvspcJ5RWB+pbn4j1nWl5ZFK5XYSdWdmgy
+CpT2Ft2vWdgkPXcCfF3ceL5oftvhv7NEq5QTwoyKxAYH8XK4Wo5xZUXYsxIwnnVEZwZNfR/4IEBR
+WZiTuC3Ala1mShxfEVmCEYrer7M0K4HZlCav1vCayEDauevdYAO2tRQi78BKKwljqGDUZWQ2fMyL
+kkIu66PpCAtlVdSER6RjUT3WD8a5O9ZDocAoyz6CIc8fVBMU7NSAK4CqQlQluem4JAYDMBDekrWZ
+50S60GYQYehSPublwZxCEgKVBobsNHIkTwdHsdLKohikTlAYyQMCqQ39NtWP9b4pSpRpD3FUTB04
+VhAMmkfTHilEpVB0gjNHwszmE4B7KLdeIPtgTEN0pLRAfftXmC4yGXuQAn7D7n9dAY3QpcLhkfoK
+BlFQhbdAM1Dsig27ehQoA+d2xWcbO8k0OUbqlmd6UMSaOKE1qEbfK5JnSbfodwpNYrzAG/DECBwB
+odI0ckQGXoYP8aSrMIiCMNK+5CDrqMbfY9OroeTaBnGYPGwlySCbCwrmuAiRjnwf5Q51CnE4hggE
+l4SfuHrBdE/O0g/kI1rgyyElXmTvxTEZVTROTJ4KsHbkACIvkw4AcRQ45OgDoA4UHGiXdx8uO5Be
+5GWAB3jhK45YXN5QM4nIaAdNGVD3iUtmoeDNwAmHSAtEjuYAYSdSKQdpwUnO8QcG05iAZCCaMZ1R
+DgE7upwqi6gl8QSi/lvwohCy9GbUDk1TGoSv0TEZf4wUvcDK96BUlzm9h1kAsVIwZ0YU0bLaG1TU
+G8w8UGjYUaaTYnJ0RetWAGnmJZW4ngFEinGPwWPNrRRKVQ2wDw24yZyKxZV8ytm2IkV5vpdPmA4J
+JslZEaf2WtSRvaMJqWLR6k0L0opJME+9wzzuwT5zJtiBKVmVx9mSfQ3+71GDcs+Ck/fv4hGnBWJ1
+EQdlIHhVfcnLfhlkXSQACZWKxe5qYMKDVqx2bC7QBRMtpQY4odeROiyPXiTNTg0u3HhaYgWYbsoD
+Ss5CHfd7cXScdR8woWMZZAlKfwGzWmdBMgnICJRL79P7IVMLRx2EVHqNHXBkHW8Zmd0tgIEgt8Dh
+yB3ALVsJqDAbVhGOPTseIHktc47C8PN16Mpsi26DWxqIRqfKq96BrikAD97LEaHRAAPYhZInO5kg
+C564Rl72iVNFHim6hYutKHEHDYpE3o7zwLd139f7fd31qkzlBbKD+jFo1SHswIk/qftDoIFWnE+j
+JClMoP9Oc23AVeSZxGzi+4I9kg/0/8ZsDeo9JBJAqDsThnc+fiCXFQa+JGr02qWA1dVz6V1ibvW4
+0TGk7JKfh6egjzXkSM51kbE6J7zVbQGx2HakyNstCivJj3hL6kkCZfLA1+JcM3JplPWX+MGnrzJD
+00KsjZsmZQ7rxK6e7LTR4PgN1emW9CW8Amb5sbAesc/RIuu0w5LzNgTvMYA/3tGUiruqbo1uRHgB
+P06ctyJ8ov9K7iCYbZIIAF4ZYQm7aTLYEAmpr5xqgP3A8yFt5IhNIgoM46OAUTCagm1NsbFldqDS
+xnSdbMEBYrdH/AcDBASVw3TuarFpT84+TMr88/ESZnjJ0+o4OZt3D9x0wCuA2S0s1gEJswOl1Beq
+CXNJidg1PNJ+EqpTkqmMAZmtbozAuKCsw90y3+9iZwg3wbjnXF1n7AnRN8ZPW89ltg3Rx8Mm7knC
+WQ6aD4eiVkC89e1xjaTUFjJoRrbNTYIRAoEYjxvPc/uRDWlz8G9/D7x6WfwFURT+u6DVWFj/08UH
+sojTm9A6YqIwAEI+GA8XO+cb0GRFdTDBi749xi3RkFsyxa9DQs8GaCAO86iPKQEoI9YNyON/QN+B
+DBRboqLone/cvn4vUt7hPvnovNzuqpvb2Ky6E/il4CAKIRzzaWOaPntN/4B1i+ENt3Jn1SAsCdcw
+niav6HXQDFMhmA6PsiQY6Pk8+012TWqYWI6+BKxFGtrL2Z/6wBISAFwctBH+MGOhq/UWyV/tzFaS
+8wNHjx6unxc2byqnWDTamk+7ooH7MJ0vzqCCY3zRZQNuSHKUp+nPmUe8QSEEmaWWUl6fmPtg3RK0
+Hl//bxLNExl+h+F0HnriaPw4/lMxDuwe/tA0c41zNHnr+Ugu+YtGlrZe1DVDH0PTMRS0ICIzqeuh
+x2iiBQ67rdB8A0ET7vIBLcBVx21167dByIQhFHmW6HLzrHx/L28hfhAnxfKleB+X7LUE2X40qEFE
+HCy0dVehWb7rJRDgUfd5daBohRKcW7fj6pKzS2egNLV8zetYmafhoxTHBJGbvhxmjENmjmwI6XXt
+6/NI2M9O0m0a+RIdS41FIezgMjEsEFF6/RsP+W/csDHDtobWy3HrT85V9RLgqGq3sMCt4UqLmnwk
+b5D8FrcuZi7RGnB3hUqPeZwDgLzkDHBd+QzU1Z5zr242RBEV7yphwjNj1kc3ENcSZKmj2BwnFPHE
+wCVBeyvlH/1gp8LLsvu1Vr7Hxvp6kYV5NUsBt4oBfRFcovLhV8rcADIg0S585nSvOG64W0fla/UD
+MpUNdFlGBI576krbdlQlhx49+6wcXU7cNoT0vbykGrBL2eyb0Ii8z45rTY665TEIzmAQcvn7urks
+YarqG4tnXBaPFNPboAzDLogjFR3Eg9iKHPUOqIQlEi4qa20op6uXKFgbVpmQoyoNZwl9zH0Z0an/
+nrZ6oIeUYVo2YSwq84kyUXFdB0VRwHJSv0hpIVTTEGtIzefEVkQyCYto4xC+mBaAoqpDeMD2XHkC
+UKiIRdbSEp+TNlvMcbzBLVhAd9/AguUSy/l5+guO6UnJEz9xheMTiR0n6kWS5IerSsMutsRUKkK5
+FgRexKQQW0IpP82bKC1GsjSYmMyJ6Yv+OxRPLodieQYcdugGMAhfcDls3RKxeJdOakcpNXEAPgM9
+kIoFBYlUXjRM5LDPzgsWaC7MLl+wNsP5cjCOWb1VmDHQ+hQG4VDa4ra4YXoeKKBCvuKNxgKMHm1r
+IP+iZ0BpZC4SwKR2UBXEIRVV2GbkPoOUfHj76qcPP7z7uP7l9fsPb969BUvw71x8ajXYmnllptoL
+vW9CWRzPhH0cTWwGhijpwJ2oMXm+c9L7424gjmT87OTZABJqaeM+MNpRfMd9dT4z1r8wLXjes5GF
+r+s9ipKHhAQ57z68xhUY7jJh2pyMzIX3mweSVRmrmFtdRJMcqejxdm5APVziG2teltscSA5v2tvp
+/ATqroJPVNYS5zXbuT5SiTKoMQpKfoQUszfviBaL7PW77+XbL5htl+8fjw1/9QKdIaUwfiefvFNJ
+mLkM37bY9G5imC5QbKmiQXKp03n21VU2lIdUN1d7df3tDXayJPVbR/ITd1/40aMy5vQmCFq+CnY3
+CRK0GKeEcvCCdUw3iFExcgY7XJggBRLvN/Bm/ldXAuU8PlW3S/TH73WDVmLRPw5VLBorjGTdSQKO
+FOAHK82oYN5LdOMWHWrUVSKp7W81USjBSUy7JiPabTwQZ6w0OhlsGI9oq3Fx47pzgoLoo1kJBjhP
+u0QRh4K95kQkosYZyUpeAVvglyXotw7dlNkUVwME5SaEsewws+PJ/hBSOBFL1qQuDzALEjmFPUMg
+i+Fxc7hCCF0nYEc7ocqtptSOqAF/HuzhJxN8nPXVSkf6NSxzTClCehHVP8rqiT58ZvWIyAt7VMBU
+h73BFPmMJjFICmFWGB4vqYZV1vIFLKRUQMo7qtE8M92JvAE910XnZ/coORhD0GzaoKYqWPdh8b8u
+xVm5pPhDKLWCUyIT6PFObMIjTZgAcH4SGCNi2gnTUj2KH3CXucvuCi7X43X0zhMkxqPqDEnlzqa/
+VdPsD1mFaSUfVfiNrxZWBp4lHxVSTJOp2A/Hqs8/JbjRm5C1AvrRfRKl6u9cWO12C1HYoJ/yvUX6
+NCTKNA/8vTO8Wxv/c58o285Wj8E6f+hv1p9YRc4EaBUx/Ss1gtHEgwLwVVSHF7cXn2Al84QxnCux
+cuikekqt1GpgiSWTvXImOdFZN1JWut4ysHoXK1/CeLdmTTHLWjzGMkoln+GYjqyztpr7TjKVMDmF
+TudC1paJVsIPrJbIZ7fv6BWWbFxlHgDwCtSf1x9YyEbHNdGTBMTuis1srjmClCceTuJZP5vPsqxh
+KgsVt3/A38YP7h1ZoNnVFaKZdO7sYcB/wEtv8o7zhSfta4C1lAO6owMXSeRCxAaqUWBEijDQdGK/
+YN3yvm9ndO52ugWdLlx6e+wNwgUA3+dl51u1mI+HyzqzKybc4BOVWTSC4XpTqZH1gn/limLMa2p5
+6pE3y3nbmDMa7O1Ihogy3bYyXOCAvdocWnR3sbgV/QA+4GsTSZ3kWDuDBRINNshLb0u/3zcWRaD2
+9Otu+XU3zb72ZQRECSjaFNvTYuCDArI/nRQC5fjtYd/MiDawpl/M+DXqUbIj4eCh0EfMLp70/ITz
+CJAPFZ5xCCCf55OThFxImUT6JCqWFBmpuLFFDGxbO6pjIM+hMZip2psci424ZK62vgQyBvnhVBey
+w42UPr+91KKKLfBGedhX3UoSZzpKseV6rIeCN4h88LMJ5Ucni2xCEZpXCoH7OMh3L+hMnXTaZjM9
+GrsYJs8WmRw0HJaC4MHLF2GJxVxPiXEFCZYaSnq7A3kFmiyz7BXXM+aKyBShsKeOIWSQebUHuSSd
+C+oRk869bow5MfJFSCEbrNCW3UAQodLk7M4VLY+3vLjYlLDG3qnoGdf6AEcRJ5AyoGh1vZ7hUT+P
+JT21CC+WnvDp17CBll9cQYhbl7OYFamV5hltxCTq0AcxiB44/44ED9NA2AMEbfOAFSDwdpluQnVJ
+V17z2dwhT6qIMPfwPTkdTTckwTF2QklkXK2moHHOHcInlHVkA2je4NmlAPemwZsHPIvBWp478GxK
+QKbBkEjK+RdS2K8woQml6kw8XkNcFBivzgntvD6vTiSppQNkuT9gC4ZllYll8SaoK+jwYomNOQfF
+8TnucT5KsWUXUO2WfaOh/TXO6Lfe/n/5bzvwKxKeKMy3QZXp+MQeq5n+RphlmFsVPRVHlBzTh1xG
+TVm7eaJ7M74e1sYGKgPGzs9JZ+xkV2s6VZ8ccwn/LwkNNn2k/kZzCCLpUepCFBInMEbe/kZ7pQT/
+JIuqn/Veij/JnGIZ+uAgzJzLnfNjVHooySqbbcRq9BXvxOxa1NdiaCYy8IQvFPErGaV40HlrYPIP
+DVi2kjcKaVsUdxMvq655uPOTorS7e2hoEO0MQeMa+JlGn72cL8W3MRuuqRSqJIqpBqZHFb/mKzhm
+OmK8tIU+yiy0umoS0askGn5NPgMI828V5ipQmvHInzeIt5uK0JdNC0iugWm8gyLhSL9V780+L6jW
+G7caybnhrT0YQ9fb236zax1XG/lpZtry45rl7kRpKa7sQrmaUjleHfTg9g681aWS+mdPA6v/In19
+l0fgQE80o1tetYeqfqpsDYrUPT5bg6KBddHhxCmFFUqfB/ZaGwMZ9xs0W9HZR0qBBXVyQpNEUk/e
+2Cgrgq4NtIjKm0p8UlGNbwD1WQS0dTDlQOGNpNTtEGNOu2c9vjx9XtM2JLjdGJv6mfQoi34ig67m
+mYsQnrXP6U3AsE5ymO3+ojx0POJYYnqXyAyPJKbTpaTJlGtyDh748zLU+jldjesSyqMARueIn5E8
++Ciw9Jo9l9rWkVAUvNGsdMQ1oB65bMdYOvncZyI7Pk7OoRiPD40fX6Z1HlF1rn6erxbGT9LKfVHJ
+MH7CixvOzDhI0bz68iDuYSiCcf+biuv89+BnqD8wcuJATtTRyZDBGQk+HxVEz3iJgRxCKHY2/qdi
+Gf8YAtZr4ULjnQ4ARo8gZEeDxTU9n1GmCjnOJbRywIR72yuQsDBIasDwOrla6y/5VoZUvQwVo1BF
+INWiUXGKPQBBZTg2ZMfKoTRJQNPwBQw5VhyhHsfGzpfCOtSyxPvtwLdr6TqdHBy4FVtepogp6IRU
+HuYj5EQklzwRQCybaany1mYrgusUPC+ullqiH91EqBiHAnZ3MwbfOdO6SkbFf8FnRr2TSChHEwzq
+H/CINpcCOeKYvDteSgUbIYHzBzy7Ad4uGTE4VPJsRsJLzaOCBDEd5ibkMQirfAtfo/AjoYKcw5m2
+yt8XSPHBNK6uSVquQYqEsrqnIsNoeqf3es/UCoNZhAcP6B2ITEtuhb8ry4UHYlKZIbP0x1lU7qjV
+qsn935vfnSXA+XBFpwanNPFo25kTVlfSNhGu0YuECfHZ6ryTMdH6FXd3cmsSwtLfsxQMLMyT9wmu
+Efa1mSBtmibSqWrs57GyC2Ln67JI0SqoLgnkik5E9eBxUaK20Pi5KYt+Nv1u6Fw9STLQ9pCW0SkR
+ani9enmDy6knqYYHqXR8MTIw+DSTXAL3f7m6metcFmOOnvS+0vLj1Iy8mXGrcS9EqKTLxz+vvw0L
+rbgAf4Ak3qQxvSEZwush6O08+4/sZTzYYBDB9mae4sfB8TVHLAEy2ABJUmO6nM4Bh+EqSWPx3tD/
+SsL0J3TNLSJPa1QmINbd1TXbSzqxCb8uXy6/9ZMTdAQFb/3Dit6amkyWF8nhKUgSpC4JqRDFaGKS
+FlIATmS0jHskmyxiHB+M35s+X3PAXHUGNOC3nG71pBFL4qWOXNP0h7JkocSeV1gc4G8T1Q2aCmkz
+smZs91HXF70cR6AvqlLVbOJK1Hhyl15j1WGQua+oehhAnS7TI2wH1vi8gYWb4sHphshTypDL5KKp
+JQO2L9P4z/v/yezVcOlTmSw9XgXrDu/wYLUU51AyK5X6HXy+zsJ9F4f2WKqL5ruz/HJSdjllxdTl
+2yGt3y6l/Ac863lvE0102nlIgPDW59L0tB+sd1Ax6Qq6FJGS0Ly/k+IvnMFQNInnrOxQOUZSduJC
+Vg/ra211o2csrKLcmk+LbOIfzcACkcnCP1hhi/v5WhYAgYcotuFhkLle0yuxl3exbXS4BeMgDJLs
+Dau8RejfXICH3bwtdTptke3zhuMnWlm5C5RulpZTMDYkq+X8zuDMDC1i09aPMG5HNf+86U+bAXJA
+IXHRkpze8IEUvRTQ4i5pr1daLvSMghZTPmlENwBJ8RTg02/uZS+1bw8I7ju5Kxa6YQD4J8LnDZLv
+e07WYmjvjllhzpqPlBhhQXOkGxOA3bAirrJh0oJvH360jegqGzoEiTfdUXbVOwGGaOF5EIQq+By9
+cEp3b92ZJ7xW1Ptpg2Ie4j7HC8kTt43IXYYL3p3Hy3JF+GBF6DI/3CigyWzlzAcxDt6j7d2MQ3cF
+PLVoIvNbfJJbrDncJtLxbdI5Mh2d3UBXpLc3MlL6n/U3xHd/evfHn398vX7z9o+v/+wd6fhXjfyi
+hXk+9tO4XrIzwiLD+M85ovItfB30hUbB799vZO2JSXdZAK7oUIvS4amiUslPlCSnTCUtl9l6s/Yx
+pbMDbnZ+SjAMjaL0vEw8DJ4CgiTTpNxeLXE4t/+rdKm/s05rAUSzwuFhyzHbWEqO0wojVaNj1CYs
+2Yy1SmosqtNns8SYxc51Gb0M4Z+NbHIVKNbwDqsoGgtbkEZ/A2L6FmbxRt5NicvOrc9OH59HS0z0
+1QGXvshZq5xM03PX5L0cCbJy89N+QbC+LO/DbIC/PSd60F7JxNZWnLz8Qe5ukTusAYzzViIe8JwN
+Or+rs1hTJd81dXderiz1f5vj2D62pZPj4IC7cWL3Wqekg+KD7gy/2AOKXVKSgJ/4duFzWDSYfsw0
+sPBgDsc4MsGM41sxDgssmPXhjGF0rogFOJxeU4/1h7xpn4fmKNAKQ6M0ZFcJxsLtV5v6wvBv6Mq/
+yj4XDWWdv6Mb5OCXsPRWL07X40ghJV3LMEmpEm5fL+03S+kzpD6Q+LS0t3kBXqK3OiOgTmoEzyP5
+kRrM/oDskZrgIpNFxEKryJ+R3mdV17E3wTDBpd60BYWQqYI7KbYbBNDSG+9NkK9hAw8otPF+fWFQ
+NKa4kEQ+AEciO/FFONWzTtEM5/5MdlvzKnZDZ9Qw2GY2H86VGn4sxicxgnxwgL6grtX6wslakk/N
+Tu/ai/XhkqPTNwMkhn9+c2IYjp5xkFb/tM4/8xTthSzl8ACtRNnR6VnGLz46m4o90oPZUzgEyh1r
+pZfDUMEreTnhVAcONYPHSGmcwTC/yw1FqaTqY2QWzna4+pcgayg53zi6EgQlZsATv2EUJXKQSkzw
+fCaTCR8AiJMd9s+zaFSrVIE+vKbWTlgNdv5f2+kOu13xSQpc+AdvLNDXhexY98BVFI/IERjtNdPK
+FhcXyjratf/d6zr4qw1Fl992yV0k9h2jmH/BQT8rOfAivRdyC/UACl2njaGlvUKQLTNd8SG3bxR6
+ekIis9BiRx56wHl4HG2UT31KJNyKAcq2JincFxieifWqnsa232A4cFc03tTOaf/L8QUtk/DA+H5M
+gApdRh7o1GctlaR1vOJWtfHT7BsZPxUoRZRSwY0r5VOf2MHWz2ik/SWUKXYWI1cyJsiM45LE43p1
+SbeZc+ebcbRClCgqFXUBK7OWr0ke+cwuJjX9n6L53rV7PqAJK+d0b+RfEls/J9bDL5H7vMRvdMnd
+fHAD22i18ue4WjmKftKHrsdPtut+t0jN6M6bJrj1+sFhwMmzGSZ9gl7PAFWO8JbkC45fJjyZkZXw
+j7umHIBFfEB1bE2tlVwpKn+nGqkf8kfZjCnkDge5KsxeuM4Xy9ZPVO8S3QGxBBivH/G8D//BBZgw
+/mnJ+Jbobnh5svenu7CqCZPKnCrn80d1Q3dIgGUIrpWncqlZ/KcnsXj4wvuTVlo0xH+LyN1aPJcj
+R4ZRLvhOeUZZrmvC2XhFTjmZx0NnvFS3v1WSUbBEp5HiGzL+F+d/r3U=
+"""
 
 ##file ez_setup.py
-EZ_SETUP_PY = """
+EMBEDDED_FILES['ez_setup.py'] = """
 eJzNWmuP28YV/a5fwShYSIJlLt8PGXKRJi5gIEiDPAoU9lY7zxVrilRJyhu1yH/vmeFDJLVU2iIf
 ysDZXXJ45z7PuXekL784nqt9ns3m8/kf87wqq4IcjVJUp2OV52lpJFlZkTQlVYJFs/fSOOcn45lk
 lVHlxqkUw7XqaWEcCftEnsSirB+ax/Pa+PuprLCApScujGqflDOZpEK9Uu0hhByEwZNCsCovzsZz
@@ -1111,10 +3406,10 @@ HrqXzRIWd9R5VEPFfF5PCjVJ9x2DCGCErNqJQX+faNveNZ9EVRetur/sT+c73THsdk3Wdy5pZKwN
 G1mpIRQKfDG/LtIWEWtV8f8PGy3Y1K330l49YAzTjnyln9YPMbri0ebhZfMXz01OyKY96lTvOWAG
 M1o/breL3U4V7G636D4FSZVEqKlr+K2j6bD9+4P9gHdev4az6lLp0VevdrrlzubhJV7UGHGRqRbV
 178BYnMUkw==
-""".decode("base64").decode("zlib")
+"""
 
 ##file activate.sh
-ACTIVATE_SH = """
+EMBEDDED_FILES['activate.sh'] = """
 eJytU11P2zAUffevuKQ8AFqJ+srUh6IhgcTKRFgnjSLXTW4aS6ld2U6zgvbfd50PSD+GNI08JLHv
 8fW5557bg4dMWkhljrAsrIM5QmExgVK6DAKrCxMjzKUKRezkWjgM4Cw1eglzYbMz1oONLiAWSmkH
 plAgHSTSYOzyDWMJtqfg5BReGNAjU3iEvoLgmN/dfuGTm/uH76Nb/m30cB3AE3wGl6GqkP7x28ND
@@ -1126,24 +3421,24 @@ p+4rB2thpJjnaLue3r6bsQ7VYcB5Z8l5wBoRuvWwPYuSjLW9m0UHHXJ+eTPm49HXK84vGljX/WxX
 TZ/Mt6GSLJiRuVGJJcJ0K+80mFVKEsdd9by1pMjJ2xa9W2FEO4rst5BxM+baSBKlgSNC5tzqIgzL
 sjx/RkdmXZ+ToUOrU1cKg6HwGUL26prHDq0ZpTxIcDqbPUFdC+YW306fvFPUaX2AWtqxH/ugsf+A
 kf/Pcf/3UW/HnBT5Axjqy2Y=
-""".decode("base64").decode("zlib")
+"""
 
 ##file activate.bat
-ACTIVATE_BAT = """
+EMBEDDED_FILES['activate.bat'] = """
 eJx9kMsOgjAQRfdN+g+zoAn8goZEDESJPBpEViSzkFbZ0IX8f+RRaVW0u5mee3PanbjeFSgpKXmI
 Hqq4KC9BglFW+YjWhEgJJa2ETvXQCNl2ogFe5CkvwaUEhjPm543vcOdAiacjLxzzJFw6f2bZCsZ0
 2YitXPtswawi1zwgC9II0QPD/RELyuOb1jB/Sg0rNhM31Ss4n2I+7ibLb8epQGco2Rja1Fs/zeoa
 cR9nWnprJaMspOQJdBR1/g==
-""".decode("base64").decode("zlib")
+"""
 
 ##file deactivate.bat
-DEACTIVATE_BAT = """
+EMBEDDED_FILES['deactivate.bat'] = """
 eJxzSE3OyFfIT0vj4spMU0hJTcvMS01RiPf3cYkP8wwKCXX0iQ8I8vcNCFHQ4FIAguLUEgWIgK0q
 FlWqXJpcICVYpGzx2OAY4oFsPpCLbjpQCLvZILVcXFaufi5cACHzOrI=
-""".decode("base64").decode("zlib")
+"""
 
 ##file distutils-init.py
-DISTUTILS_INIT = """
+EMBEDDED_FILES['distutils-init.py'] = """
 eJytVl2L6zYQffevGBKK7XavKe3bhVBo78uFSyml0IdlEVpbTtR1JCMpm6S/vjOSY0v+uO1DDbs4
 0tF8nJk5sjz32jjQNpPhzd7H1ys3SqqjhcfCL1q18vgbN1YY2Kc/pQWlHXB4l8ZdeCfUO5x1c+nE
 E1gNVwE1V3CxAqQDp6GVqgF3EmBd08nXLGukUfws4IDBVD13p2pYoS3rLk52ltF6hPhLS1XM4EUc
@@ -1163,17 +3458,17 @@ fTPbyj+mZnZ2wSQK8RaT9Km0ySRuLpm0DkUUL0ra3WQ2BgGJ7v9I9SKqNKZ/IR4R28RHm+vEz5ic
 nZ2IH7bfub8pU1PR3gr10W7xLTfHh6Z6bgZ7K14G7Mj/1z5J6MFo6V5e07H0Ou78dTyeI+mxKOpI
 eC2KMSj6HKxd6Uudf/n886fPv+f++x1lbASlmjQuPz8OvGA0j7j2eCu/4bcW6SFeCuNJ0W1GQHI5
 iwC9Ey0bjtHd9P4dPA++XxLnZDVuxvFEtlm3lf5a2c02u2LRYXHH/AOs8pIa
-""".decode("base64").decode("zlib")
+"""
 
 ##file distutils.cfg
-DISTUTILS_CFG = """
+EMBEDDED_FILES['distutils.cfg'] = """
 eJxNj00KwkAMhfc9xYNuxe4Ft57AjYiUtDO1wXSmNJnK3N5pdSEEAu8nH6lxHVlRhtDHMPATA4uH
 xJ4EFmGbvfJiicSHFRzUSISMY6hq3GLCRLnIvSTnEefN0FIjw5tF0Hkk9Q5dRunBsVoyFi24aaLg
 9FDOlL0FPGluf4QjcInLlxd6f6rqkgPu/5nHLg0cXCscXoozRrP51DRT3j9QNl99AP53T2Q=
-""".decode("base64").decode("zlib")
+"""
 
 ##file activate_this.py
-ACTIVATE_THIS = """
+EMBEDDED_FILES['activate_this.py'] = """
 eJx1UsGOnDAMvecrIlYriDRlKvU20h5aaY+teuilGo1QALO4CwlKAjP8fe1QGGalRoLEefbzs+Mk
 Sb7NcvRo3iTcoGqwgyy06As+HWSNVciKaBTFywYoJWc7yit2ndBVwEkHkIzKCV0YdQdmkvShs6YH
 E3IhfjFaaSNLoHxQy2sLJrL0ow98JQmEG/rAYn7OobVGogngBgf0P0hjgwgt7HOUaI5DdBVJkggR
@@ -1183,7 +3478,7 @@ JR/m9GPDHv2oSZunUokS2A/WBelnvx6tF6LUJO2FjjlH5zU6Q+Kz/9m69LxvSZVSwiOlGnT1rt/A
 1JDruuadNGcPmkgiBTnQXUGUDd6IK9JEQ9yPdM96xZP8bieeMRqTuqbxIbbey2DjVUNzRs1rosFS
 TsLAdS/0fBGNdTGKhuqD7mUmsFlgGjN2eSj1tM3GnjfXwwCmzjhMbR4rLZXXk+Z/6Hp7Pn2+kJ49
 jfgLHgI4Jg==
-""".decode("base64").decode("zlib")
+"""
 
 if __name__ == '__main__':
     main()
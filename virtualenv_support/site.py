@@ -1,17 +1,34 @@
 # The virtualenv "site.py"
 
-import os, sys
+import os, sys, imp, marshal
 
 # Welcome to virtualenv!
 
 # The virtual environment logic is invested in the following function,
 # rather than just running in the global scope of this module, because
-# multiple virtual environments might be stacked on top of each other,
-# and when each environment calls "execfile()" on its parent's "site.py"
-# any global variables in this module are overwritten.
+# the system "site.py" is executed in the globals of this module, and
+# any global variables here might be overwritten by it.  (This is also
+# why virtualenv_init() binds the helper functions defined further down
+# to local names before it does anything else: so that no "site.py"
+# can swap them out from under us halfway through.)
 
 def virtualenv_init():
-    
+    load_snapshot = _load_snapshot
+    save_snapshot = _save_snapshot
+    load_code = _load_code
+    install_module_index = _install_module_index
+    SiteTrace = _SiteTrace
+    LazyPthImports = _LazyPthImports
+    addsitedir_traced = _addsitedir
+    run_pth_import = _run_pth_import
+    report_pth_error = _report_pth_error
+
+    # If the VIRTUALENV_SITE_TRACE environment variable names a file,
+    # we time each of the steps below, as well as each ".pth" file and
+    # each "import" line in them, and append the results to that file.
+
+    trace = SiteTrace(os.environ.get('VIRTUALENV_SITE_TRACE'))
+
     # First, we determine where this present virtualenv is located, and
     # note what its native sys.prefix is.
 
@@ -19,12 +36,43 @@ def virtualenv_init():
     prefix = sys.prefix
     exec_prefix = sys.exec_prefix
 
+    # If a previous run of this function left behind a snapshot of its
+    # work, and none of the files that it depended on have changed since
+    # (our "orig-prefix.txt", our "site-packages" directory, and any of
+    # the ".pth" files inside of it), then we can skip reading
+    # "orig-prefix.txt", the search for the system "site.py" and the
+    # scan of our "site-packages" further below.
+
+    snapshot = load_snapshot(libpython)
+    trace.phase('load-snapshot')
+
     # Next, we read the cached sys.prefix of the Python installation
     # that was used to create this virtual environment.
+    #
+    # Environments can be stacked on top of each other: the prefix in
+    # "orig-prefix.txt" might itself be that of another virtual
+    # environment, with its own "orig-prefix.txt".  Rather than have
+    # each environment run its parent's "site.py" in turn, we follow the
+    # chain down to the real Python installation ourselves, and then do
+    # the work for all of the "layers" of the stack at once.  (The
+    # snapshot records the whole chain, so that a stack costs no more at
+    # startup than a single environment.)
 
-    f = open(os.path.join(libpython, 'orig-prefix.txt'))
-    sys.real_prefix = f.read().strip()
-    f.close()
+    if snapshot is not None:
+        sys.real_prefix = snapshot['real_prefix']
+        layers = snapshot['layers']
+    else:
+        layers = [libpython]
+        while True:
+            f = open(os.path.join(layers[-1], 'orig-prefix.txt'))
+            sys.real_prefix = f.read().strip()
+            f.close()
+            parent_libpython = libpython.replace(prefix, sys.real_prefix, 1)
+            if (parent_libpython in layers or not os.path.exists(
+                    os.path.join(parent_libpython, 'orig-prefix.txt'))):
+                break
+            layers.append(parent_libpython)
+    trace.phase('read-orig-prefix')
 
     # And, finally, we breathe a sign of relief!  Up to this point, the
     # virtual environment's Python has been running on the tiny set of
@@ -37,7 +85,7 @@ def virtualenv_init():
     # save a copy of the PYTHONPATH paths, so that we can move them back
     # to the beginning of sys.path when we are all done.
 
-    if 'PYTHONPATH' in os.environ:
+    if os.environ.get('PYTHONPATH'):
         pythonpath_len = os.environ['PYTHONPATH'].count(':') + 1
     else:
         pythonpath_len = 0
@@ -58,31 +106,43 @@ def virtualenv_init():
     # sys.path, we are ready to invoke its own "site.py" file.  To make
     # it run correctly, we have to temporarily set sys.prefix and
     # sys.exec_prefix to the value that the parent environment expects,
-    # then set them back when "site.py" is done working.
+    # then set them back when "site.py" is done working.  Rather than
+    # compiling "site.py" from source every time, as "execfile()" would,
+    # we keep its code object in "orig-site.pyc" and only recompile it
+    # when the path, modification time or size of the source changes.
 
-    for i in range(pythonpath_len, len(sys.path)):
-        real_site_py = os.path.join(sys.path[i], 'site.py')
-        if os.path.exists(real_site_py):
-            break
+    if snapshot is not None:
+        real_site_py = snapshot['site_py']
+    else:
+        for i in range(pythonpath_len, len(sys.path)):
+            real_site_py = os.path.join(sys.path[i], 'site.py')
+            if os.path.exists(real_site_py):
+                break
+    trace.phase('locate-site-py')
 
     sys.prefix = sys.real_prefix
     sys.exec_prefix = sys.real_prefix
-    execfile(real_site_py, globals())
+    code = load_code(real_site_py, os.path.join(libpython, 'orig-site.pyc'))
+    exec code in globals()
     sys.prefix = prefix
     sys.exec_prefix = exec_prefix
+    trace.phase('exec-site-py')
 
     # Running the parent environment's "site.py" will not only have set
     # up things like OS-specific encodings, and defined functions for us
     # like "addsitedir()" (which we will use in a moment) in our own
-    # globals (since we passed "globals()" to "execfile()"), but will
+    # globals (since we executed it in "globals()"), but will
     # have supplemented sys.path with all of the directories that the
     # system Python uses for site packages.  If it turns out the creator
-    # of this virtual environment does not want to use system-wide site
-    # packages, then we revert sys.path back to the pristine value that
-    # it had before we let the system "site.py" monkey with it.
+    # of this virtual environment (or of any environment that it is
+    # stacked upon) does not want to use system-wide site packages, then
+    # we revert sys.path back to the pristine value that it had before
+    # we let the system "site.py" monkey with it.
 
-    if os.path.exists(os.path.join(libpython, 'no-global-site-packages.txt')):
-        sys.path = clean_sys_path
+    for layer in layers:
+        if os.path.exists(os.path.join(layer, 'no-global-site-packages.txt')):
+            sys.path = clean_sys_path
+            break
 
     # Finally, we reach what is really the whole point of a virtual
     # environment: including, at the head of sys.path, the directories
@@ -90,10 +150,63 @@ def virtualenv_init():
     # own "site-packages" directory.  We use the system Python's
     # "addsitedir()" routine to do this scanning, to make sure that
     # ".pth" files are discovered using the official logic of this
-    # version of Python.
+    # version of Python.  If we are stacked on other environments, we
+    # scan their "site-packages" first, bottommost parent first, each
+    # time moving what the scan added to the front; that way, every
+    # environment's packages take precedence over those of the
+    # environments beneath it.
+    #
+    # If we have a snapshot, we instead run the "import" lines of all of
+    # the ".pth" files, which the snapshot holds in order, each compiled
+    # to a code object of its own, and append the paths that the scans
+    # produced last time, in the order they ended up in.  Like
+    # addsitedir(), we report a line that fails and ignore the rest of
+    # its file.
+    #
+    # When tracing, we need to time each ".pth" file and "import" line
+    # separately, which the system's addsitedir() cannot do, so we
+    # process them one by one.  The same goes for when
+    # "lazy-pth-imports.txt" asks for "import" lines to be put off until
+    # a module that they name is first imported.
+
+    lazy = LazyPthImports(libpython, trace.run_import)
+    if lazy.enabled:
+        run_import = lazy.run_import
+    else:
+        run_import = trace.run_import
+    one_by_one = trace.enabled or lazy.enabled
 
     old_sys_path = list(sys.path)
-    addsitedir(os.path.join(libpython, 'site-packages'))
+    if snapshot is not None:
+        failed = {}
+        for sitedir, name, n, line, code in snapshot['imports']:
+            if (sitedir, name) in failed:
+                continue
+            try:
+                if one_by_one:
+                    run_import(sitedir, name, line)
+                elif code is None:
+                    # It did not compile; running it reports why
+                    run_pth_import(sitedir, line)
+                else:
+                    run_pth_import(sitedir, code)
+            except Exception:
+                report_pth_error(n, os.path.join(sitedir, name))
+                failed[sitedir, name] = True
+        sys.path = old_sys_path + [ path for path in snapshot['paths']
+                                    if path not in old_sys_path ]
+    else:
+        for layer in reversed(layers):
+            layer_old_sys_path = list(sys.path)
+            if one_by_one:
+                addsitedir_traced(os.path.join(layer, 'site-packages'),
+                                  run_import, trace)
+            else:
+                addsitedir(os.path.join(layer, 'site-packages'))
+            sys.path = ([ path for path in sys.path
+                          if path not in layer_old_sys_path ]
+                        + layer_old_sys_path)
+    trace.phase('addsitedir')
 
     # Finallly, since running addsitedir() adds paths both near the
     # beginning and close to the end of the site.path (because the .pth
@@ -113,13 +226,539 @@ def virtualenv_init():
             new_paths.append(path)
 
     sys.path = pythonpath_paths + new_paths + old_paths
+    trace.phase('reorder')
+
+    # Paths that PYTHONPATH named were left out of new_paths above (and
+    # addsitedir() never adds those already on sys.path), so a snapshot
+    # taken now would lose them for runs without PYTHONPATH.
+
+    if snapshot is None and not pythonpath_len:
+        save_snapshot(libpython, layers, real_site_py, new_paths)
+        trace.phase('save-snapshot')
+
+    # With a long sys.path, every import has to look in directory after
+    # directory before it finds its module.  If "virtualenv
+    # --index-modules" has recorded which sys.path entry each top-level
+    # module lives in, we install an import hook that goes straight
+    # there instead.
+
+    install_module_index(libpython)
+    lazy.install()
+    trace.phase('module-index')
+    trace.write()
+
+# The snapshot lives next to "orig-prefix.txt" and is written with the
+# "marshal" module, which is built into the interpreter and so can be
+# used before sys.path is ready.  Its "stamps" are the modification
+# times of everything whose change would change the result of following
+# the chain of "orig-prefix.txt" files or of scanning the
+# "site-packages" directories along it; if any of them differ, the
+# snapshot is ignored and rewritten by the full run.  The same goes for
+# the directories that the ".pth" files name, which addsitedir() only
+# adds if they exist: the snapshot records which of them did.  Being
+# unable to write it, for instance in a read-only environment, is not
+# an error.
+
+SNAPSHOT_VERSION = 7
+
+def _snapshot_stamps(layers, pth_files):
+    paths = []
+    for layer in layers:
+        paths.append(os.path.join(layer, 'orig-prefix.txt'))
+        paths.append(os.path.join(layer, 'site-packages'))
+    paths.extend(pth_files)
+    stamps = []
+    for path in paths:
+        try:
+            stamps.append((path, os.stat(path).st_mtime))
+        except OSError:
+            return None
+    return stamps
+
+def _load_snapshot(libpython):
+    try:
+        f = open(os.path.join(libpython, 'sys-path-snapshot.dat'), 'rb')
+        try:
+            snapshot = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if (not isinstance(snapshot, dict)
+        or snapshot.get('version') != SNAPSHOT_VERSION
+        or snapshot['layers'][0] != libpython
+        or _snapshot_stamps(snapshot['layers'], snapshot['pth_files'])
+           != snapshot['stamps']):
+        return None
+    for path, exists in snapshot['pth_entries']:
+        if os.path.exists(path) != exists:
+            return None
+    return snapshot
+
+def _save_snapshot(libpython, layers, real_site_py, new_paths):
+    # The ".pth" files are listed in the order in which virtualenv_init()
+    # scanned them: bottommost parent environment first.
+    pth_files = []
+    for layer in reversed(layers):
+        site_packages = os.path.join(layer, 'site-packages')
+        try:
+            names = os.listdir(site_packages)
+        except OSError:
+            continue
+        names = [ name for name in names if name.endswith('.pth') ]
+        names.sort()
+        for name in names:
+            pth_files.append(os.path.join(site_packages, name))
+    imports = []
+    pth_entries = []
+    for filename in pth_files:
+        try:
+            f = open(filename, 'rU')
+            try:
+                lines = f.readlines()
+            finally:
+                f.close()
+        except IOError:
+            continue
+        for n, line in enumerate(lines):
+            if line.startswith('#') or not line.strip():
+                continue
+            if not _is_pth_import(line):
+                path = os.path.abspath(os.path.join(os.path.dirname(filename),
+                                                    line.rstrip()))
+                pth_entries.append((path, os.path.exists(path)))
+                continue
+            try:
+                # Padded so that tracebacks give the line of the file
+                code = compile('\n' * n + line.rstrip() + '\n', filename,
+                               'exec')
+            except SyntaxError:
+                code = None
+            imports.append((os.path.dirname(filename),
+                            os.path.basename(filename), n, line.rstrip(),
+                            code))
+    stamps = _snapshot_stamps(layers, pth_files)
+    if stamps is None:
+        return
+    snapshot = {'version': SNAPSHOT_VERSION, 'layers': layers,
+                'real_prefix': sys.real_prefix,
+                'stamps': stamps, 'pth_files': pth_files,
+                'site_py': real_site_py, 'paths': new_paths,
+                'imports': imports, 'pth_entries': pth_entries}
+    _write_marshalled(os.path.join(libpython, 'sys-path-snapshot.dat'),
+                      snapshot)
+
+def _load_code(filename, cache_filename):
+    st = os.stat(filename)
+    key = (filename, st.st_mtime, st.st_size, imp.get_magic())
+    try:
+        f = open(cache_filename, 'rb')
+        try:
+            cached_key, code = marshal.load(f)
+        finally:
+            f.close()
+        if cached_key == key:
+            return code
+    except (IOError, EOFError, ValueError, TypeError):
+        pass
+    f = open(filename, 'rU')
+    try:
+        source = f.read()
+    finally:
+        f.close()
+    code = compile(source + '\n', filename, 'exec')
+    if not getattr(sys, 'dont_write_bytecode', False):
+        _write_marshalled(cache_filename, (key, code))
+    return code
+
+def _write_marshalled(filename, value):
+    # Write to a temporary file first and rename it into place, so that
+    # concurrently starting interpreters never see a partial file.
+    tmp_filename = '%s.%s' % (filename, os.getpid())
+    try:
+        f = open(tmp_filename, 'wb')
+        try:
+            marshal.dump(value, f)
+        finally:
+            f.close()
+        os.rename(tmp_filename, filename)
+    except (IOError, OSError):
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+
+# When VIRTUALENV_SITE_TRACE is set, each process appends one line per
+# measurement to the file it names, in four tab-separated columns: the
+# process id, the kind of measurement ("phase", "pth" or "import"), what
+# was measured (the step, the ".pth" file, or the ".pth" file and its
+# "import" line) and the time it took in seconds.  All of a process's
+# lines are written with a single write() call at the end, so that
+# concurrent processes do not interleave their lines.
+
+class _SiteTrace(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.enabled = bool(filename)
+        self.records = []
+        if self.enabled:
+            import time
+            self.clock = time.time
+            self.last = self.clock()
+
+    def start(self):
+        if self.enabled:
+            return self.clock()
+
+    def record(self, kind, name, start):
+        if self.enabled:
+            self.records.append((kind, name, self.clock() - start))
+
+    def phase(self, name):
+        if self.enabled:
+            self.record('phase', name, self.last)
+            self.last = self.clock()
+
+    def run_import(self, sitedir, name, line):
+        start = self.start()
+        try:
+            _run_pth_import(sitedir, line)
+        finally:
+            self.record('import', '%s: %s' % (name, line), start)
+
+    def write(self):
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        lines = [ '%s\t%s\t%s\t%.6f\n'
+                  % (pid, kind, name.replace('\t', ' '), seconds)
+                  for kind, name, seconds in self.records ]
+        try:
+            f = open(self.filename, 'a')
+            try:
+                f.write(''.join(lines))
+            finally:
+                f.close()
+        except IOError:
+            pass
+
+def _is_pth_import(line):
+    return line.startswith('import ') or line.startswith('import\t')
+
+def _run_pth_import(sitedir, line):
+    # Run the line (or its code object) the way the system's addpackage()
+    # does: in a frame with a "sitedir" local, which the lines that
+    # setuptools writes into "-nspkg.pth" files look up with
+    # sys._getframe(1).
+    exec line
+
+def _report_pth_error(n, filename):
+    import traceback
+    sys.stderr.write('Error processing line %d of %s:\n\n' % (n + 1, filename))
+    traceback.print_exc()
+    sys.stderr.write('\nRemainder of file ignored\n')
+
+def _addsitedir(sitedir, run_import, trace):
+    # The same scan as the system's addsitedir() does, except that each
+    # "import" line is handed to run_import() and that each ".pth" file
+    # is timed.
+    known_paths = {}
+    for path in sys.path:
+        if os.path.isdir(path):
+            known_paths[os.path.normcase(os.path.abspath(path))] = True
+    sitedir = os.path.abspath(sitedir)
+    if os.path.normcase(sitedir) not in known_paths:
+        sys.path.append(sitedir)
+        known_paths[os.path.normcase(sitedir)] = True
+    try:
+        names = os.listdir(sitedir)
+    except OSError:
+        return
+    names = [ name for name in names if name.endswith(os.extsep + 'pth') ]
+    names.sort()
+    for name in names:
+        start = trace.start()
+        try:
+            f = open(os.path.join(sitedir, name), 'rU')
+        except IOError:
+            continue
+        try:
+            for n, line in enumerate(f):
+                if line.startswith('#'):
+                    continue
+                try:
+                    if _is_pth_import(line):
+                        run_import(sitedir, name, line.rstrip())
+                        continue
+                    path = os.path.abspath(
+                        os.path.join(sitedir, line.rstrip()))
+                    pathcase = os.path.normcase(path)
+                    if pathcase not in known_paths and os.path.exists(path):
+                        sys.path.append(path)
+                        known_paths[pathcase] = True
+                except Exception:
+                    _report_pth_error(n, os.path.join(sitedir, name))
+                    break
+        finally:
+            f.close()
+        trace.record('pth', name, start)
+
+# In lazy mode, which "lazy-pth-imports.txt" turns on, an "import" line
+# of a ".pth" file is put off if it names any module that has not been
+# imported yet; it then runs the first time that one of those modules,
+# or the package that the ".pth" file is named after, is imported.  The
+# lines of "lazy-pth-imports.txt" form the allowlist of lines that still
+# run right away: each names either a ".pth" file, all of whose lines
+# are run, or the beginning of the lines to run.  Lines that only name
+# modules that are already imported, like the "import sys" bookkeeping
+# lines of "easy-install.pth", always run right away.
+
+class _LazyPthImports(object):
+
+    def __init__(self, libpython, run_now):
+        self.run_now = run_now
+        self.pending = []
+        try:
+            f = open(os.path.join(libpython, 'lazy-pth-imports.txt'))
+        except IOError:
+            self.enabled = False
+            return
+        try:
+            lines = f.readlines()
+        finally:
+            f.close()
+        self.enabled = True
+        self.eager = [ line.strip() for line in lines
+                       if line.strip() and not line.startswith('#') ]
+
+    def run_import(self, sitedir, name, line):
+        for entry in self.eager:
+            if name == entry or line.startswith(entry):
+                self.run_now(sitedir, name, line)
+                return
+        triggers = self.triggers(name, line)
+        if triggers:
+            self.pending.append((triggers, sitedir, name, line))
+        else:
+            self.run_now(sitedir, name, line)
+
+    def triggers(self, name, line):
+        modules = []
+        for statement in line.split(';'):
+            words = statement.split()
+            if words[:1] == ['import']:
+                for module in ' '.join(words[1:]).split(','):
+                    module = module.split()
+                    if module:
+                        modules.append(module[0])
+            elif words[:1] == ['from'] and len(words) > 1:
+                modules.append(words[1])
+        triggers = {}
+        for module in modules:
+            module = module.split('.')[0]
+            if module not in sys.modules:
+                triggers[module] = True
+        if triggers:
+            # "foo.pth" and "foo-1.0-nspkg.pth" both belong to "foo".
+            triggers[name.split('-')[0].split('.')[0]] = True
+        return triggers
+
+    def install(self):
+        if self.pending:
+            sys.meta_path.insert(0, self)
+
+    def find_module(self, fullname, path=None):
+        top = fullname.split('.')[0]
+        ready = [ item for item in self.pending if top in item[0] ]
+        if not ready:
+            return None
+        self.pending = [ item for item in self.pending if top not in item[0] ]
+        for triggers, sitedir, name, line in ready:
+            try:
+                self.run_now(sitedir, name, line)
+            except Exception:
+                import traceback
+                sys.stderr.write('Error running deferred line of %s:\n'
+                                 % name)
+                traceback.print_exc()
+        if fullname in sys.modules:
+            # The line itself imported the module; hand that one back
+            # rather than letting Python import it a second time.
+            return self
+        return None
+
+    def load_module(self, fullname):
+        return sys.modules[fullname]
+
+# The module index, "module-index.dat", is written by the function
+# build_module_index() below, which "virtualenv --index-modules" runs
+# inside of the environment's own interpreter.  It maps the name of each
+# top-level module to every sys.path entry that provides it, and records
+# the modification time of every entry that it listed.  At startup, only
+# entries whose modification time still matches are trusted; for those,
+# ModuleIndexFinder knows without looking whether they hold a given
+# module, wherever they have since moved to on sys.path.  Any other
+# entry, like the current directory or a directory that has since had
+# packages installed into it, is searched the ordinary way.  And if the
+# index turns out to be wrong about a module, the finder steps aside
+# and lets Python look for it.
+
+MODULE_INDEX_VERSION = 2
+
+class ModuleIndexFinder(object):
+
+    def __init__(self, modules, known_entries):
+        self.modules = modules
+        self.known_entries = known_entries
+
+    def find_module(self, fullname, path=None):
+        if path is not None or fullname in sys.builtin_module_names:
+            return None
+        indexed_entries = self.modules.get(fullname, ())
+        for entry in sys.path:
+            if entry in self.known_entries:
+                if entry not in indexed_entries:
+                    continue
+                try:
+                    return self.find_in_directory(fullname, entry)
+                except ImportError:
+                    return None
+            importer = self.get_importer(entry)
+            if importer is None:
+                try:
+                    return self.find_in_directory(fullname, entry)
+                except ImportError:
+                    continue
+            elif isinstance(importer, getattr(imp, 'NullImporter', ())):
+                continue
+            else:
+                loader = importer.find_module(fullname)
+                if loader is not None:
+                    return loader
+        return None
+
+    def get_importer(self, entry):
+        # The same steps as Python's own import takes for each entry.
+        try:
+            return sys.path_importer_cache[entry]
+        except KeyError:
+            pass
+        importer = None
+        for hook in sys.path_hooks:
+            try:
+                importer = hook(entry)
+                break
+            except ImportError:
+                pass
+        else:
+            if hasattr(imp, 'NullImporter'):
+                try:
+                    importer = imp.NullImporter(entry)
+                except ImportError:
+                    pass
+        sys.path_importer_cache[entry] = importer
+        return importer
+
+    def find_in_directory(self, fullname, entry):
+        if not os.path.isdir(entry or '.'):
+            # A zip file; let zipimport do the rest.
+            import zipimport
+            loader = zipimport.zipimporter(entry).find_module(fullname)
+            if loader is None:
+                raise ImportError(fullname)
+            return loader
+        return ModuleIndexLoader(*imp.find_module(fullname, [entry]))
+
+class ModuleIndexLoader(object):
+
+    def __init__(self, file, pathname, description):
+        self.file = file
+        self.pathname = pathname
+        self.description = description
+
+    def load_module(self, fullname):
+        try:
+            return imp.load_module(fullname, self.file, self.pathname,
+                                   self.description)
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+def _module_index_stamp(entry):
+    try:
+        return os.stat(entry).st_mtime
+    except OSError:
+        return None
+
+def _install_module_index(libpython):
+    try:
+        f = open(os.path.join(libpython, 'module-index.dat'), 'rb')
+        try:
+            index = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return
+    if (not isinstance(index, dict)
+        or index.get('version') != MODULE_INDEX_VERSION):
+        return
+    stamps = index['stamps']
+    known_entries = {}
+    for entry in sys.path:
+        if entry in stamps and _module_index_stamp(entry) == stamps[entry]:
+            known_entries[entry] = True
+    sys.meta_path.append(ModuleIndexFinder(index['modules'], known_entries))
+
+def build_module_index():
+    """Write "module-index.dat" for the current sys.path"""
+    import zipfile
+    libpython = os.path.dirname(__file__)
+    suffixes = [ suffix for suffix, mode, type in imp.get_suffixes() ]
+    modules = {}
+    stamps = {}
+    for entry in sys.path:
+        if entry in stamps or not os.path.isabs(entry):
+            # The current directory, or a script's directory, changes
+            # from one process to the next and so is never indexed.
+            continue
+        stamps[entry] = _module_index_stamp(entry)
+        if os.path.isdir(entry):
+            names = []
+            for filename in os.listdir(entry):
+                if '.' not in filename:
+                    for suffix in suffixes:
+                        if os.path.isfile(os.path.join(
+                                entry, filename, '__init__' + suffix)):
+                            names.append(filename)
+                            break
+                    continue
+                for suffix in suffixes:
+                    if filename.endswith(suffix):
+                        names.append(filename[:-len(suffix)])
+                        break
+        elif zipfile.is_zipfile(entry):
+            z = zipfile.ZipFile(entry)
+            try:
+                names = [ name.split('/')[0].split('.')[0]
+                          for name in z.namelist() ]
+            finally:
+                z.close()
+        else:
+            continue
+        for name in names:
+            if name not in modules:
+                modules[name] = [entry]
+            elif entry not in modules[name]:
+                modules[name].append(entry)
+    _write_marshalled(os.path.join(libpython, 'module-index.dat'),
+                      {'version': MODULE_INDEX_VERSION, 'stamps': stamps,
+                       'modules': modules})
 
-# Having defined the above function, we now run it.  If several virtual
-# environments are stacked on top of each other, then the function gets
-# re-defined anew for each of their "site.py" files that are processed;
-# only the bottommost virtual environment's definition of the function
-# survives.  (Which does not really matter, since we never use it again,
-# but it seemed worth mentioning in case anyone ever experiments down
-# here in the future.)
+# Having defined the above functions, we now run virtualenv_init().
+# Even when several virtual environments are stacked on top of each
+# other, only the topmost one's "site.py" runs (virtualenv_init() does
+# the work of the layers beneath it), so the definitions above are the
+# ones that stay in use, like the module index classes.
 
 virtualenv_init()